@@ -0,0 +1,58 @@
+import os
+import time
+
+'''
+    Micro benchmarks for performance sensitive code. Run each module directly from the project root, for example:
+
+        python -m benchmarks.storage_urls
+
+    Benchmarks don't need AWS access, storages use the in process fake S3 backend unless S3_FAKE_BACKEND is set.
+'''
+
+
+def setup():
+    """
+        Configures django with the project settings so benchmarks can import project modules.
+    """
+    import django
+    from django.conf import settings
+
+    if settings.configured:
+        return
+
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "project_name.settings")
+    os.environ.setdefault("S3_FAKE_BACKEND", "memory")
+    django.setup()
+
+
+def measure(fun, number=1, repeat=3):
+    """
+        Calls fun number times, repeat times, and returns the best time per call in seconds.
+    """
+    best = None
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fun()
+        elapsed = (time.perf_counter() - start) / number
+        best = elapsed if best is None else min(best, elapsed)
+
+    return best
+
+
+def format_time(seconds):
+    if seconds >= 1:
+        return u"{0:.2f} s".format(seconds)
+    if seconds >= 0.001:
+        return u"{0:.2f} ms".format(seconds * 1000)
+    return u"{0:.2f} us".format(seconds * 1000000)
+
+
+def report(title, rows):
+    """
+        Prints a list of (label, seconds) rows.
+    """
+    print(title)
+    for label, seconds in rows:
+        print(u"    {0:<40} {1:>12}".format(label, format_time(seconds)))
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import resource
+import tempfile
+import subprocess
+from io import BytesIO
+from benchmarks import setup, format_time
+
+'''
+    Compares creating 1024, 512 and 128 pixels thumbnails of a 24 megapixel JPEG with one create call per size
+    against a single create_many call. Each variant runs on its own process to measure its CPU time and peak RSS,
+    the test image is also generated on its own process since peak RSS is kept across fork and exec.
+'''
+
+SIZE = (6000, 4000)
+SIZES = ((1024, 1024), (512, 512), (128, 128))
+
+
+def make_image(path):
+    from PIL import Image, ImageDraw
+
+    img = Image.new('RGB', SIZE, (40, 90, 160))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, SIZE[0], 50):
+        draw.line((i, 0, SIZE[0] - i, SIZE[1]), fill=(i % 256, 255 - i % 256, 128), width=5)
+
+    img.save(path, format='JPEG', quality=90)
+
+
+def run_variant(variant, path):
+    """
+        Runs a variant on the image at path, returning its CPU time.
+    """
+    from core.utils import ImageThumbnail
+
+    class Thumbnail(ImageThumbnail):
+        max_file_size = 1024 * 1024 * 50
+
+    with open(path, 'rb') as f:
+        data = f.read()
+
+    start = time.process_time()
+
+    if variant == 'create':
+        for size in SIZES:
+            Thumbnail.size = size
+            res, _ = Thumbnail.create(BytesIO(data))
+            res.close()
+    else:
+        renditions, _ = Thumbnail.create_many(BytesIO(data), SIZES)
+        for _, res in renditions:
+            res.close()
+
+    return time.process_time() - start
+
+
+def run():
+    fd, path = tempfile.mkstemp(suffix='.jpg')
+    os.close(fd)
+
+    try:
+        subprocess.check_call([sys.executable, '-m', 'benchmarks.image_thumbnails', 'image', path])
+        print(u"{0}x{1} JPEG to {2} pixels".format(SIZE[0], SIZE[1], ', '.join(str(s[0]) for s in SIZES)))
+
+        for variant, label in (('create', 'create for each size'), ('create_many', 'create_many')):
+            out = subprocess.check_output([sys.executable, '-m', 'benchmarks.image_thumbnails', variant, path])
+            cpu, rss = out.decode('utf-8').split()
+            print(u"    {0:<30} cpu {1:>10}    peak rss {2:>6.1f} mb".format(
+                label, format_time(float(cpu)), int(rss) / 1024.0))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    setup()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'image':
+        make_image(sys.argv[2])
+    elif len(sys.argv) > 2:
+        cpu = run_variant(sys.argv[1], sys.argv[2])
+        # ru_maxrss is in kb on Linux
+        print(cpu, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    else:
+        run()
@@ -0,0 +1,85 @@
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+from benchmarks import setup, format_time
+
+'''
+    Compares merging 60 PDFs of 20 pages (about 1mb each) with NewPdfWriter and StreamingPdfWriter.
+    Each variant runs on its own process to measure its time and peak RSS, the test files are also generated on
+    their own process since peak RSS is kept across fork and exec.
+'''
+
+DOCUMENTS = 60
+PAGES = 20
+
+
+def make_documents(folder):
+    from pdfrw import PdfWriter, PdfDict, PdfName, PdfArray, IndirectPdfDict
+
+    for i in range(DOCUMENTS):
+        writer = PdfWriter()
+        for _ in range(PAGES):
+            contents = IndirectPdfDict()
+            # Random hex comment so pages are not tiny
+            contents.stream = u"% {0}\nBT /F1 12 Tf 20 100 Td (page) Tj ET".format(os.urandom(25000).hex())
+            writer.addpage(PdfDict(Type=PdfName.Page, MediaBox=PdfArray([0, 0, 300, 200]), Contents=contents))
+
+        writer.write(os.path.join(folder, u"{0}.pdf".format(i)))
+
+
+def run_variant(variant, folder):
+    """
+        Merges the documents of folder, returning the elapsed time.
+    """
+    from pdfrw import PdfReader
+    from core.utils import NewPdfWriter, StreamingPdfWriter
+
+    paths = [os.path.join(folder, u"{0}.pdf".format(i)) for i in range(DOCUMENTS)]
+    start = time.perf_counter()
+
+    with open(os.devnull, 'wb') as f:
+        if variant == 'NewPdfWriter':
+            writer = NewPdfWriter()
+            for path in paths:
+                writer.addpages(PdfReader(path).pages)
+            writer.write(f)
+        else:
+            writer = StreamingPdfWriter(f)
+            for path in paths:
+                writer.add_document(path)
+            writer.close()
+
+    return time.perf_counter() - start
+
+
+def run():
+    folder = tempfile.mkdtemp()
+
+    try:
+        subprocess.check_call([sys.executable, '-m', 'benchmarks.pdf_merge', 'documents', folder])
+        print(u"{0} documents of {1} pages".format(DOCUMENTS, PAGES))
+
+        for variant in ('NewPdfWriter', 'StreamingPdfWriter'):
+            out = subprocess.check_output([sys.executable, '-m', 'benchmarks.pdf_merge', variant, folder])
+            elapsed, rss = out.decode('utf-8').split()
+            print(u"    {0:<30} {1:>10}    peak rss {2:>6.1f} mb".format(
+                variant, format_time(float(elapsed)), int(rss) / 1024.0))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    setup()
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'documents':
+        make_documents(sys.argv[2])
+    elif len(sys.argv) > 2:
+        elapsed = run_variant(sys.argv[1], sys.argv[2])
+        # ru_maxrss is in kb on Linux
+        print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    else:
+        run()
@@ -0,0 +1,58 @@
+import os
+from benchmarks import setup, measure, report
+
+'''
+    Compares building a 10k entries table of contents (100 chapters of 99 sections) with add_bookmark calls
+    and with set_outline, and writing the resulting PDF.
+'''
+
+CHAPTERS = 100
+SECTIONS = 99
+PAGES = 200
+
+
+def make_writer():
+    from pdfrw import PdfDict, PdfName, PdfArray
+    from core.utils import NewPdfWriter
+
+    writer = NewPdfWriter()
+    for _ in range(PAGES):
+        writer.addpage(PdfDict(Type=PdfName.Page, MediaBox=PdfArray([0, 0, 300, 200])))
+    return writer
+
+
+def make_tree():
+    return [
+        (u"Chapter {0}".format(c), c * 2, [(u"Section {0}.{1}".format(c, s), c * 2 + 1) for s in range(SECTIONS)])
+        for c in range(CHAPTERS)
+    ]
+
+
+def add_bookmarks(writer, tree):
+    for title, page_num, children in tree:
+        parent = writer.add_bookmark(title, page_num)
+        for child_title, child_page_num in children:
+            writer.add_bookmark(child_title, child_page_num, parent)
+
+
+def write(build):
+    writer = make_writer()
+    build(writer)
+    with open(os.devnull, 'wb') as f:
+        writer.write(f)
+
+
+def run():
+    tree = make_tree()
+
+    report(u"Outline of {0} entries".format(CHAPTERS * (SECTIONS + 1)), [
+        ('add_bookmark', measure(lambda: add_bookmarks(make_writer(), tree))),
+        ('set_outline', measure(lambda: make_writer().set_outline(tree))),
+        ('add_bookmark + write', measure(lambda: write(lambda writer: add_bookmarks(writer, tree)))),
+        ('set_outline + write', measure(lambda: write(lambda writer: writer.set_outline(tree)))),
+    ])
+
+
+if __name__ == '__main__':
+    setup()
+    run()
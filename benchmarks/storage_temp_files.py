@@ -0,0 +1,62 @@
+import os
+import hashlib
+from benchmarks import setup, measure, report
+
+'''
+    Compares reading a 64mb downloaded temporary file through the file object and through getbuffer,
+    hashing it and copying 1mb slices.
+'''
+
+SIZE = 1024 * 1024 * 64
+CHUNK = 1024 * 1024
+
+
+def run():
+    from core.storages import BaseS3Storage
+
+    class Storage(BaseS3Storage):
+        fake_s3 = 'memory'
+        max_memory_file_size = 1024 * 1024  # Spill to a temporary file
+
+    storage = Storage()
+    storage.upload_file('benchmark/f', os.urandom(SIZE))
+    f = storage.download_file('benchmark/f', stream=False)
+
+    def hash_read():
+        f.seek(0)
+        h = hashlib.md5()
+        while 1:
+            buf = f.read(64 * 1024)
+            if not buf:
+                break
+            h.update(buf)
+
+    def hash_buffer():
+        view = f.getbuffer()
+        hashlib.md5(view).digest()
+        view.release()
+
+    def slices_read():
+        for offset in range(0, SIZE, CHUNK):
+            f.seek(offset)
+            f.read(CHUNK)
+
+    def slices_buffer():
+        view = f.getbuffer()
+        for offset in range(0, SIZE, CHUNK):
+            bytes(view[offset:offset + CHUNK])
+        view.release()
+
+    report('64mb temporary file', [
+        ('md5, read 64kb chunks', measure(hash_read)),
+        ('md5, getbuffer', measure(hash_buffer)),
+        ('1mb slices, seek and read', measure(slices_read)),
+        ('1mb slices, getbuffer', measure(slices_buffer)),
+    ])
+
+    f.close()
+
+
+if __name__ == '__main__':
+    setup()
+    run()
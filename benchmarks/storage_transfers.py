@@ -0,0 +1,40 @@
+import os
+from io import BytesIO
+from benchmarks import setup, measure, report
+
+'''
+    Compares single request and parallel uploads and downloads of a 32mb file on the fake S3 backend,
+    simulating 20ms of latency per request and 20mb/s per connection.
+'''
+
+SIZE = 1024 * 1024 * 32
+
+
+def run():
+    from core.storages import BaseS3Storage
+
+    class SingleStorage(BaseS3Storage):
+        fake_s3 = 'memory'
+        fake_s3_latency = 0.02
+        fake_s3_bandwidth = 1024 * 1024 * 20
+        multipart_threshold = SIZE * 2
+        download_threshold = SIZE * 2
+        max_memory_file_size = SIZE * 2
+
+    class ParallelStorage(SingleStorage):
+        multipart_threshold = 1024 * 1024 * 8
+        download_threshold = 1024 * 1024 * 8
+
+    data = os.urandom(SIZE)
+    rows = []
+
+    for label, storage in (('single request', SingleStorage()), ('parallel', ParallelStorage())):
+        rows.append(('upload, ' + label, measure(lambda: storage.upload_file('benchmark/f', BytesIO(data)))))
+        rows.append(('download, ' + label, measure(lambda: storage.download_file('benchmark/f', stream=False))))
+
+    report('32mb transfer time', rows)
+
+
+if __name__ == '__main__':
+    setup()
+    run()
@@ -0,0 +1,39 @@
+from benchmarks import setup, measure, report
+
+'''
+    Compares BaseS3Storage.url cost with and without the signed url cache, rendering a list of 100 files 10 times
+    like a serializer would do.
+'''
+
+
+def run():
+    from core.storages import BaseS3Storage
+
+    # Use boto3 signing, it doesn't need network access.
+    class NoCacheStorage(BaseS3Storage):
+        s3_key = 'benchmark'
+        s3_secret = 'benchmark'
+        s3_bucket = 'benchmark'
+        fake_s3 = ''
+        url_cache_refresh = 0
+
+    class CacheStorage(NoCacheStorage):
+        url_cache_refresh = 0.5
+
+    names = ['benchmark/files/{0}.pdf'.format(i) for i in range(100)]
+    rows = []
+
+    for label, storage in (('url, no cache', NoCacheStorage()), ('url, cached', CacheStorage())):
+        def render():
+            for _ in range(10):
+                for name in names:
+                    storage.url(name)
+
+        rows.append((label, measure(render) / (10 * len(names))))
+
+    report('Signed url cost per call', rows)
+
+
+if __name__ == '__main__':
+    setup()
+    run()
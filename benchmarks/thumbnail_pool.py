@@ -0,0 +1,59 @@
+import os
+from io import BytesIO
+from multiprocessing.pool import ThreadPool
+from benchmarks import setup, measure
+
+'''
+    Thumbnails throughput of 10 request threads (like a mod_wsgi process) creating thumbnails of 12 megapixel
+    JPEGs on the calling threads and on process pools of different sizes, up to the amount of cores.
+'''
+
+THREADS = 10
+IMAGES = 40
+SIZE = (4000, 3000)
+
+
+def make_image():
+    from PIL import Image, ImageDraw
+
+    img = Image.new('RGB', SIZE, (40, 90, 160))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, SIZE[0], 50):
+        draw.line((i, 0, SIZE[0] - i, SIZE[1]), fill=(i % 256, 255 - i % 256, 128), width=5)
+
+    data = BytesIO()
+    img.save(data, format='JPEG', quality=90)
+    return data.getvalue()
+
+
+def run():
+    from core.utils import ImageThumbnail
+    from core.thumbnails import ThumbnailService
+
+    data = make_image()
+    threads = ThreadPool(THREADS)
+    cores = os.cpu_count() or 1
+
+    print(u"{0} thumbnails of {1}x{2} JPEGs from {3} threads, {4} cores".format(
+        IMAGES, SIZE[0], SIZE[1], THREADS, cores))
+
+    for workers in sorted(set([0, 1, 2, 4, cores])):
+        if workers > max(cores, 2):
+            continue
+
+        service = ThumbnailService(ImageThumbnail, workers=workers, max_pending=max(workers * 2, 1))
+        service.create_many(BytesIO(data))  # Start the workers
+
+        def create(_):
+            renditions, _ = service.create_many(BytesIO(data))
+            for _, f in renditions:
+                f.close()
+
+        elapsed = measure(lambda: threads.map(create, range(IMAGES)), repeat=2)
+        label = u"{0} processes".format(workers) if workers else 'request threads'
+        print(u"    {0:<40} {1:>8.1f} images/s".format(label, IMAGES / elapsed))
+
+
+if __name__ == '__main__':
+    setup()
+    run()
@@ -0,0 +1,57 @@
+import os
+from io import BytesIO
+from zipfile import ZIP_DEFLATED
+from benchmarks import setup, format_time, measure
+
+'''
+    Compares zipping 24 files of 2mb from a fake S3 with 20ms latency and 40mb/s per connection, downloading each
+    file and then compressing it, against ZipExport prefetching 4 files ahead.
+'''
+
+FILES = 24
+SIZE = 1024 * 1024 * 2
+
+
+def run():
+    from core.storages import BaseS3Storage
+    from core.utils import ZipFile2
+    from core.zip_exports import ZipExport
+
+    class Storage(BaseS3Storage):
+        fake_s3 = 'memory'
+        fake_s3_latency = 0.02
+        fake_s3_bandwidth = 1024 * 1024 * 40
+
+    storage = Storage()
+    names = [u"benchmark/f{0}".format(i) for i in range(FILES)]
+    for name in names:
+        # Half random, half compressible
+        storage.upload_file(name, os.urandom(SIZE // 2) + b'abcd' * (SIZE // 8))
+
+    def sequential():
+        with ZipFile2(BytesIO(), 'w', ZIP_DEFLATED) as z:
+            for name in names:
+                f = storage.download_file(name, stream=False)
+                z.write_stream(name, f)
+                f.close()
+
+    exports = []
+
+    def pipeline():
+        export = ZipExport(storage, names, prefetch=4)
+        export.write(BytesIO())
+        exports.append(export)
+
+    print(u"{0} files of 2mb".format(FILES))
+    print(u"    {0:<40} {1:>12}".format('download then compress', format_time(measure(sequential))))
+    print(u"    {0:<40} {1:>12}".format('ZipExport, prefetch 4', format_time(measure(pipeline))))
+
+    stats = exports[-1].get_stats()
+    print(u"    stages: download {0}, waiting downloads {1}, compress and write {2} ({3} bound)".format(
+        format_time(stats['download']), format_time(stats['download_wait']), format_time(stats['write']),
+        stats['bound']))
+
+
+if __name__ == '__main__':
+    setup()
+    run()
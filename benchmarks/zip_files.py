@@ -0,0 +1,44 @@
+import os
+import random
+from io import BytesIO
+from zipfile import ZIP_DEFLATED
+from benchmarks import setup, measure, report
+
+'''
+    Compares writing a zip of 16 compressible 4mb entries with sequential write_stream calls and with write_many.
+'''
+
+ENTRIES = 16
+SIZE = 1024 * 1024 * 4
+
+
+def make_entry(seed):
+    rnd = random.Random(seed)
+    words = [os.urandom(rnd.randint(2, 8)).hex().encode('ascii') for _ in range(2000)]
+    data = b' '.join(rnd.choice(words) for _ in range(SIZE // 8))
+    return data[:SIZE]
+
+
+def run():
+    from core.utils import ZipFile2
+
+    entries = [make_entry(i) for i in range(ENTRIES)]
+
+    def write_stream():
+        with ZipFile2(BytesIO(), 'w', ZIP_DEFLATED) as z:
+            for i, data in enumerate(entries):
+                z.write_stream(u"f{0}".format(i), BytesIO(data))
+
+    def write_many():
+        with ZipFile2(BytesIO(), 'w', ZIP_DEFLATED) as z:
+            z.write_many((u"f{0}".format(i), BytesIO(data)) for i, data in enumerate(entries))
+
+    report(u"{0} entries of 4mb, {1} cores".format(ENTRIES, os.cpu_count()), [
+        ('write_stream', measure(write_stream)),
+        (u"write_many, {0} threads".format(ZipFile2.compress_workers), measure(write_many)),
+    ])
+
+
+if __name__ == '__main__':
+    setup()
+    run()
@@ -3,6 +3,7 @@
 """
 
 from django.apps import AppConfig
+from django.conf import settings
 import sys
 
 
@@ -17,5 +18,7 @@ class Config(AppConfig):
             # Do not run if already started or management command
         if not self.is_started and len(sys.argv) > 0 and not sys.argv[0].endswith('manage.py'):
             # Code that needs to be ran before app start can be run here.
-            pass
+            if settings.S3_RESUME_UPLOADS:
+                from core.storages import resume_background_uploads
+                resume_background_uploads()
         self.is_started = True
@@ -3,9 +3,109 @@ from django.conf import settings
 from datetime import timedelta
 from django.utils import timezone
 from dateutil import parser, tz
-from django.core.cache import cache
+from django.core.cache import caches
+from builtins import object
+from threading import Lock
+from clients.models import User
 from core.exceptions import AuthenticationFailed
 from core.auth import validate_user_jwt
+from core.memory_cache import LRUCache
+import hashlib
+import logging
+import time
+
+auth_logger = logging.getLogger('clients.auth')
+
+
+class TokenCache(object):
+    """
+        Cache of validated user tokens with two tiers: a small in process LRU cache (L1) in front of the 'auth'
+        django cache (L2), which should be shared by all processes and hosts.
+        Entries are a compact snapshot of the user fields instead of a pickled User, keyed by the token hash.
+        Entries live for timeout seconds at most (never past the token expiration), so password changes
+        and locked users take effect within that time.
+    """
+
+    cache_alias = 'auth'
+    timeout = 15
+    local_size = 1000
+    local_timeout = 5  # Shorter, as local entries aren't refreshed when the shared ones expire.
+
+    # Fields kept on the snapshot, in model order. Others are loaded from the database if accessed.
+    user_fields = ('id', 'email', 'first_name', 'last_name', 'last_password_change', 'is_active')
+
+    def __init__(self):
+        self._local = LRUCache(self.local_size, self.local_timeout)
+        self._lock = Lock()
+        self.stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @staticmethod
+    def _key(token):
+        # Tokens are not stored on the shared cache, and hashes fit memcached key limits.
+        return 'tk_' + hashlib.sha256(token.encode('utf-8')).hexdigest()
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def get(self, token):
+        """
+            Returns the cached (user, token_data) of token or None.
+        """
+        key = self._key(token)
+
+        entry = self._local.get(key)
+        if entry is not None:
+            self._count('local_hits')
+            return self._load(entry)
+
+        try:
+            entry = caches[self.cache_alias].get(key)
+        except Exception as e:
+            auth_logger.error("Token cache get failed.", extra={'extra': str(e)})
+            entry = None
+
+        if entry is None:
+            self._count('misses')
+            return None
+
+        self._count('shared_hits')
+        self._local.set(key, entry, min(self.local_timeout, entry[2] - time.time()))
+        return self._load(entry)
+
+    def set(self, token, user, token_data):
+        timeout = min(self.timeout, token_data['exp'] - time.time())
+        if timeout <= 0:
+            return
+
+        key = self._key(token)
+        entry = (tuple(getattr(user, f) for f in self.user_fields), token_data, time.time() + timeout)
+
+        self._local.set(key, entry, min(self.local_timeout, timeout))
+
+        try:
+            caches[self.cache_alias].set(key, entry, timeout)
+        except Exception as e:
+            auth_logger.error("Token cache set failed.", extra={'extra': str(e)})
+
+    def _load(self, entry):
+        values, token_data, _ = entry
+        return User.from_db('default', self.user_fields, values), token_data
+
+    def get_stats(self):
+        """
+            Returns the hits and misses counts of this process with 'hit_ratio' (any tier) and 'local_hit_ratio'.
+        """
+        with self._lock:
+            stats = dict(self.stats)
+
+        total = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_ratio'] = float(stats['local_hits'] + stats['shared_hits']) / total if total else 0.0
+        stats['local_hit_ratio'] = float(stats['local_hits']) / total if total else 0.0
+        return stats
+
+
+token_cache = TokenCache()
 
 
 class JWTUserAuthenticator(authentication.BaseAuthentication):
@@ -27,21 +127,18 @@ class JWTUserAuthenticator(authentication.BaseAuthentication):
             return None
 
         # Check token cache
-        cache_key = 'tk_' + token
-        exists = cache.get(cache_key)
-        if exists:
-            return exists
+        res = token_cache.get(token)
+        if res:
+            return res
 
         # Not found, get it
         user, token_data = validate_user_jwt(token)
 
-        # cache results with 15s timeout. Small enough to avoid inconsistencies but strong
+        # Cache results for a few seconds. Small enough to avoid inconsistencies but strong
         # enough to greatly help on multiple concurrent requests
-        res = (user, token_data)
-        cache.set(cache_key, res, 15)
+        token_cache.set(token, user, token_data)
 
-        # For now just get the first user found
-        return res
+        return user, token_data
 
     def authenticate_header(self, request):
         """
@@ -1,6 +1,10 @@
 import json
-from rest_framework.test import APITestCase, APIClient
+import time
+from django.core.cache import caches
+from rest_framework.test import APITestCase, APIClient, APIRequestFactory
 from clients.models import User
+from clients.auth.user_auth import JWTUserAuthenticator, TokenCache
+from core.auth import create_user_jwt
 from django.contrib.auth.hashers import check_password
 
 
@@ -101,3 +105,43 @@ class ChangePassword(APITestCase):
         self.assertEqual(response.status_code, 400)
         content = response.data
         self.assertEqual(len(content['detail']['old_password']), 1)
+
+
+# Token cache
+class TokenCacheTests(APITestCase):
+    def setUp(self):
+        caches['auth'].clear()
+        self.user = User(email="fabricio@asap.uy", first_name="Fabricio", is_active=True)
+        self.user.save()
+        self.token = create_user_jwt(self.user).decode("utf-8")
+        self.request = APIRequestFactory().get('/', HTTP_AUTHORIZATION='Token ' + self.token)
+
+    def test_authenticate_cached(self):
+        authenticator = JWTUserAuthenticator()
+        user, token_data = authenticator.authenticate(self.request)
+
+        with self.assertNumQueries(0):
+            cached_user, cached_data = authenticator.authenticate(self.request)
+
+        self.assertEqual(cached_data, token_data)
+        self.assertEqual((cached_user.pk, cached_user.email, cached_user.first_name),
+                         (user.pk, "fabricio@asap.uy", "Fabricio"))
+
+    def test_tiers(self):
+        cache = TokenCache()
+        self.assertIsNone(cache.get(self.token))
+
+        cache.set(self.token, self.user, {'id': self.user.pk, 'exp': time.time() + 60})
+        self.assertEqual(cache.get(self.token)[0].pk, self.user.pk)
+
+        # Other process, only the shared tier has it
+        with self.assertNumQueries(0):
+            self.assertEqual(TokenCache().get(self.token)[0].email, "fabricio@asap.uy")
+
+        self.assertEqual(cache.get_stats(), {'local_hits': 1, 'shared_hits': 0, 'misses': 1, 'hit_ratio': 0.5,
+                                             'local_hit_ratio': 0.5})
+
+    def test_expired_not_cached(self):
+        cache = TokenCache()
+        cache.set(self.token, self.user, {'id': self.user.pk, 'exp': time.time() - 1})
+        self.assertIsNone(cache.get(self.token))
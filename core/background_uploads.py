@@ -0,0 +1,237 @@
+import os
+import json
+import time
+import shutil
+import logging
+import tempfile
+
+from builtins import str
+from builtins import object
+from uuid import uuid4
+from threading import Lock
+from core.thread_pool import ThreadPool
+from core.memory_cache import LRUCache
+from core.exceptions import OperationError, ExceptionCodes
+
+'''
+    Background uploads for storages, so requests don't wait for S3.
+    Files are spooled to a local folder together with a record of the pending upload, and uploaded on a
+    dedicated thread pool. Records are named after the process handling them (pid and start time, as pids are
+    reused after restarts), so records left by a dead process are resumed by the next process that starts an
+    uploader on the same folder. Uploaders are started on the first background save, or on startup by
+    resume_background_uploads (see core.storages). Failed uploads are kept for failed_retention seconds.
+'''
+
+s3logger = logging.getLogger('storages.s3')
+
+MESSAGES = {
+    'queue_full': "Too many pending uploads, try again later."
+}
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Exists but owned by other user.
+    return True
+
+
+def _process_id(pid=None):
+    """
+        Returns an identifier of a process, its pid and start time so reused pids don't match.
+        Only the pid where the start time is not available (not Linux).
+    """
+    pid = pid or os.getpid()
+
+    try:
+        with open('/proc/{0}/stat'.format(pid)) as f:
+            # Fields after the command name, which can have spaces. Start time is field 22.
+            return u"{0}-{1}".format(pid, f.read().rsplit(')', 1)[1].split()[19])
+    except (IOError, OSError, IndexError):
+        return str(pid)
+
+
+def _process_alive(process_id):
+    pid = int(process_id.split('-', 1)[0])
+
+    if not _pid_alive(pid):
+        return False
+
+    # Same pid but maybe another process, for example after a container restart.
+    return '-' not in process_id or _process_id(pid) == process_id
+
+
+class BackgroundUploader(object):
+    failed_retention = 60 * 60 * 24 * 7  # Seconds failed uploads files are kept for inspection.
+
+    def __init__(self, storage, path, workers, max_pending):
+        """
+            storage: storage used to upload the files.
+            path: folder to spool files and records, can be shared by all processes of the host.
+            workers: upload threads (scaled by THREAD_POOL_SIZE_FACTOR).
+            max_pending: max amount of queued and running uploads on this process, new ones are rejected.
+        """
+        self.pid = os.getpid()
+        self.process_id = _process_id()
+        self.storage = storage
+        self.path = path
+        self.max_pending = max_pending
+        self.pool = ThreadPool(workers=workers)
+
+        self._lock = Lock()
+        self._pending = 0
+        self._last_cleanup = 0
+        self._status = LRUCache(max(max_pending * 10, 1000))
+
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+
+        self.resume()
+
+    def _record_path(self, upload_id, process_id=None):
+        return os.path.join(self.path, u"{0}.{1}.run".format(upload_id, process_id or self.process_id))
+
+    def submit(self, name, content, meta=None, callback=None):
+        """
+            Spools content and queues its upload, returning name without waiting for S3.
+            callback, if given, is called on the upload thread with (name, error) once done, error being None on
+            success.
+            Raises OperationError with a 503 status if there are already max_pending uploads.
+        """
+        if time.time() - self._last_cleanup > self.failed_retention / 10:
+            self.cleanup()
+
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise OperationError(MESSAGES['queue_full'], ExceptionCodes.uploadQueueFull, 503)
+            self._pending += 1
+
+        try:
+            upload_id = uuid4().hex
+            data_path = os.path.join(self.path, upload_id + '.data')
+
+            with open(data_path, 'wb') as f:
+                if hasattr(content, 'read'):
+                    if hasattr(content, 'seek'):
+                        content.seek(0)
+                    shutil.copyfileobj(content, f, 64 * 1024)
+                else:
+                    f.write(content)
+
+            self._write_record(upload_id, {'name': name, 'meta': meta})
+
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+
+        self._status.set(name, PENDING)
+        self.pool.apply_async(self._upload, (upload_id, name, meta, callback))
+
+        return name
+
+    def status(self, name):
+        """
+            Returns 'pending', 'done' or 'failed' for files submitted by this process, or None if unknown.
+        """
+        return self._status.get(name)
+
+    def resume(self):
+        """
+            Queues the uploads left by processes that are no longer running.
+            Each record is claimed renaming it, so only one process resumes it.
+        """
+        self.cleanup()
+
+        for file_name in os.listdir(self.path):
+            parts = file_name.split('.')
+            try:
+                if len(parts) != 3 or parts[2] != 'run' or _process_alive(parts[1]):
+                    continue
+            except ValueError:
+                continue  # Not a record
+
+            upload_id = parts[0]
+            try:
+                os.rename(os.path.join(self.path, file_name), self._record_path(upload_id))
+                with open(self._record_path(upload_id), 'r') as f:
+                    record = json.load(f)
+            except (IOError, OSError, ValueError):
+                continue  # Claimed by other process
+
+            s3logger.info("Resuming background upload.", extra={'extra': record['name']})
+
+            with self._lock:
+                self._pending += 1
+
+            self._status.set(record['name'], PENDING)
+            self.pool.apply_async(self._upload, (upload_id, record['name'], record['meta'], None))
+
+    def cleanup(self):
+        """
+            Removes the files of uploads failed more than failed_retention seconds ago, and data files left without
+            record (process died while spooling). Called on startup and on submit every failed_retention / 10 seconds.
+        """
+        self._last_cleanup = time.time()
+        limit = time.time() - self.failed_retention
+        file_names = os.listdir(self.path)
+        records = set(file_name.split('.', 1)[0] for file_name in file_names if file_name.endswith('.run'))
+
+        for file_name in file_names:
+            upload_id, _, extension = file_name.partition('.')
+            if extension not in ('failed', 'data') or (extension == 'data' and upload_id in records):
+                continue
+
+            path = os.path.join(self.path, file_name)
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.remove(path)
+            except OSError:
+                pass  # Removed by other process
+
+    def _write_record(self, upload_id, record):
+        # Write and rename so the record is never seen partially written.
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(temp_path, self._record_path(upload_id))
+
+    def _upload(self, upload_id, name, meta, callback):
+        data_path = os.path.join(self.path, upload_id + '.data')
+        error = None
+
+        try:
+            with open(data_path, 'rb') as f:
+                self.storage.upload_file(name, f, meta)
+
+            os.remove(self._record_path(upload_id))
+            os.remove(data_path)
+            self._status.set(name, DONE)
+
+        except Exception as e:
+            # Keep failed files around for inspection, they won't be resumed.
+            error = str(e)
+            s3logger.error("Failed background upload.", extra={'extra': name + ": " + error})
+            self._status.set(name, FAILED)
+
+            try:
+                os.rename(self._record_path(upload_id), os.path.join(self.path, upload_id + '.failed'))
+            except OSError:
+                pass
+
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+        if callback:
+            try:
+                callback(name, error)
+            except Exception as e:
+                s3logger.error("Background upload callback failed.", extra={'extra': name + ": " + str(e)})
@@ -48,6 +48,8 @@ class ExceptionCodes(object):
     dataTooBig = 'dataTooBig'
 
     s3Error = 's3Error'
+    uploadQueueFull = 'uploadQueueFull'
+    jobQueueFull = 'jobQueueFull'
     emailSendingError = 'emailSendingError'
 
     unknownError = 'unknownError'
@@ -86,6 +88,22 @@ class OperationError(APIException):
         return str(self.detail)
 
 
+class NotModified(APIException):
+    """
+        Raised by conditional requests when the resource matches the given ETag.
+    """
+    status_code = status.HTTP_304_NOT_MODIFIED
+    default_detail = "Not modified."
+
+
+class RangeNotSatisfiable(APIException):
+    """
+        Raised when a requested byte range is not valid for the resource.
+    """
+    status_code = status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE
+    default_detail = "Requested range not satisfiable."
+
+
 def _force_text_recursive(data):
     """
         Copied from library to also include tuples
@@ -0,0 +1,389 @@
+import os
+import re
+import json
+import time
+import hashlib
+
+from builtins import str
+from builtins import object
+from uuid import uuid4
+from threading import Lock
+from bisect import bisect_right
+from datetime import datetime
+from dateutil import tz, parser
+from io import BytesIO
+from urllib.parse import quote
+from botocore.exceptions import ClientError
+
+'''
+    Fake S3 backend so storages can be used offline, for tests and benchmarks.
+    FakeS3ClientFunctions implements the same functions as core.storages.S3ClientFunctions against a memory or
+    folder store, including ETags, conditional and range requests, multipart uploads and listing pagination.
+    Latency (seconds per request) and bandwidth (bytes per second) can be simulated.
+'''
+
+UTC = tz.tzutc()
+RANGE_REGEX = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+_stores = {}
+_stores_lock = Lock()
+
+
+def get_store(location):
+    """
+        Returns the process wide store for location, 'memory' or a folder path.
+    """
+    with _stores_lock:
+        store = _stores.get(location)
+        if store is None:
+            store = _stores[location] = MemoryStore() if location == 'memory' else FolderStore(location)
+        return store
+
+
+def _error(status, code, message=''):
+    return ClientError({'Error': {'Code': code, 'Message': message},
+                        'ResponseMetadata': {'HTTPStatusCode': status}}, 'FakeS3')
+
+
+def _etag(data):
+    return '"{0}"'.format(hashlib.md5(data).hexdigest())
+
+
+class MemoryStore(object):
+    """
+        Keeps files in memory as {bucket: {key: (data, info)}}.
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = Lock()
+
+    def get(self, bucket, key):
+        with self._lock:
+            return self._buckets.get(bucket, {}).get(key, None)
+
+    def put(self, bucket, key, data, info):
+        with self._lock:
+            self._buckets.setdefault(bucket, {})[key] = (data, info)
+
+    def delete(self, bucket, key):
+        with self._lock:
+            self._buckets.get(bucket, {}).pop(key, None)
+
+    def keys(self, bucket):
+        with self._lock:
+            return sorted(self._buckets.get(bucket, {}))
+
+    def clear(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+class FolderStore(object):
+    """
+        Keeps files in a folder, each file as a data file and a json info file named after the key hash.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _path(self, bucket, key):
+        folder = os.path.join(self.path, bucket)
+        if not os.path.isdir(folder):
+            os.makedirs(folder, exist_ok=True)
+        return os.path.join(folder, hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def get(self, bucket, key):
+        path = self._path(bucket, key)
+        try:
+            with open(path + '.json', 'r') as f:
+                info = json.load(f)
+            with open(path + '.data', 'rb') as f:
+                data = f.read()
+        except (IOError, OSError):
+            return None
+
+        info['LastModified'] = parser.parse(info['LastModified'])
+        return data, info
+
+    def put(self, bucket, key, data, info):
+        path = self._path(bucket, key)
+        info = dict(info, LastModified=info['LastModified'].isoformat(), Key=key)
+
+        with open(path + '.data.tmp', 'wb') as f:
+            f.write(data)
+        with open(path + '.json.tmp', 'w') as f:
+            json.dump(info, f)
+
+        os.replace(path + '.data.tmp', path + '.data')
+        os.replace(path + '.json.tmp', path + '.json')
+
+    def delete(self, bucket, key):
+        path = self._path(bucket, key)
+        for ext in ('.json', '.data'):
+            try:
+                os.remove(path + ext)
+            except OSError:
+                pass
+
+    def keys(self, bucket):
+        folder = os.path.dirname(self._path(bucket, ''))
+        keys = []
+        for name in os.listdir(folder):
+            if name.endswith('.json'):
+                with open(os.path.join(folder, name), 'r') as f:
+                    keys.append(json.load(f)['Key'])
+        return sorted(keys)
+
+    def clear(self):
+        for bucket in os.listdir(self.path):
+            for name in os.listdir(os.path.join(self.path, bucket)):
+                os.remove(os.path.join(self.path, bucket, name))
+
+
+class FakeStreamingBody(object):
+    """
+        Response body with the read and close methods of botocore's StreamingBody, throttled to a bandwidth.
+    """
+
+    def __init__(self, data, bandwidth=None):
+        self._data = BytesIO(data)
+        self.bandwidth = bandwidth
+
+    def read(self, amt=None):
+        data = self._data.read(amt)
+        if self.bandwidth and data:
+            time.sleep(len(data) / float(self.bandwidth))
+        return data
+
+    def close(self):
+        self._data.close()
+
+
+class FakeS3ClientFunctions(object):
+    """
+        Same functions as S3ClientFunctions, working on a fake store.
+    """
+
+    def __init__(self, storage, store, latency=0, bandwidth=None):
+        self.pid = os.getpid()
+        self.client = None
+        self.store = store
+        self.bucket = storage.s3_bucket
+        self.secret = storage.s3_secret or 'fake'
+        self.latency = latency
+        self.bandwidth = bandwidth
+
+        self.defaults = {
+            'ACL': storage.acl,
+            'CacheControl': storage.cache_control,
+            'StorageClass': storage.storage_class
+        }
+
+        self._uploads = {}
+        self._lock = Lock()
+
+    def _wait(self, size=0):
+        delay = self.latency
+        if self.bandwidth and size:
+            delay += size / float(self.bandwidth)
+        if delay:
+            time.sleep(delay)
+
+    def _get(self, key):
+        res = self.store.get(self.bucket, key)
+        if res is None:
+            raise _error(404, 'NoSuchKey', 'The specified key does not exist.')
+        return res
+
+    @staticmethod
+    def _read_body(body):
+        if isinstance(body, (bytes, bytearray)):
+            return bytes(body)
+        if isinstance(body, str):
+            return body.encode('utf-8')
+        return body.read()
+
+    def generate_signed_url(self, Params, ExpiresIn):
+        expires = int(time.time()) + ExpiresIn
+        signature = hashlib.sha1(u"{0}{1}{2}".format(self.secret, Params['Key'], expires).encode('utf-8'))
+        return u"https://fake-s3/{0}/{1}?Expires={2}&Signature={3}".format(
+            Params['Bucket'], quote(Params['Key']), expires, signature.hexdigest())
+
+    def put_object(self, Key, Body, ContentType=None, Metadata=None, **kwargs):
+        data = self._read_body(Body)
+        self._wait(len(data))
+
+        info = dict(self.defaults, ContentType=ContentType or 'binary/octet-stream', Metadata=Metadata or {},
+                    ETag=_etag(data), LastModified=datetime.now(UTC).replace(microsecond=0))
+        info.update(kwargs)
+        self.store.put(self.bucket, Key, data, info)
+
+        return {'ETag': info['ETag']}
+
+    def _check_conditions(self, info, IfMatch=None, IfNoneMatch=None):
+        if IfMatch and IfMatch != info['ETag']:
+            raise _error(412, 'PreconditionFailed', 'At least one of the pre-conditions you specified did not hold')
+        if IfNoneMatch and IfNoneMatch == info['ETag']:
+            raise _error(304, '304', 'Not Modified')
+
+    def _info(self, data, info):
+        return {
+            'ContentType': info['ContentType'],
+            'ContentLength': len(data),
+            'LastModified': info['LastModified'],
+            'Metadata': dict(info['Metadata']),
+            'ETag': info['ETag']
+        }
+
+    def head_object(self, Key, IfMatch=None, IfNoneMatch=None):
+        self._wait()
+        data, info = self._get(Key)
+        self._check_conditions(info, IfMatch, IfNoneMatch)
+        return self._info(data, info)
+
+    def get_object(self, Key, Range=None, IfMatch=None, IfNoneMatch=None):
+        data, info = self._get(Key)
+        self._check_conditions(info, IfMatch, IfNoneMatch)
+        res = self._info(data, info)
+        size = len(data)
+
+        match = RANGE_REGEX.match(Range) if Range else None
+        if match and (match.group(1) or match.group(2)):
+            start, end = match.group(1), match.group(2)
+
+            if not start:
+                start, end = max(size - int(end), 0), size - 1
+            else:
+                start, end = int(start), min(int(end), size - 1) if end else size - 1
+
+            if start >= size or start > end:
+                self._wait()
+                raise _error(416, 'InvalidRange', 'The requested range is not satisfiable')
+
+            data = data[start:end + 1]
+            res['ContentLength'] = len(data)
+            res['ContentRange'] = 'bytes {0}-{1}/{2}'.format(start, end, size)
+
+        # Latency now, the body is throttled while read.
+        self._wait()
+        res['Body'] = FakeStreamingBody(data, self.bandwidth)
+        return res
+
+    def delete_object(self, Key):
+        self._wait()
+        self.store.delete(self.bucket, Key)
+        return {}
+
+    def delete_objects(self, Delete):
+        self._wait()
+        for d in Delete['Objects']:
+            self.store.delete(self.bucket, d['Key'])
+        return {} if Delete.get('Quiet') else {'Deleted': [{'Key': d['Key']} for d in Delete['Objects']]}
+
+    def list_objects(self, Prefix='', Delimiter=None, MaxKeys=1000, ContinuationToken=None, StartAfter=None):
+        self._wait()
+        keys = [k for k in self.store.keys(self.bucket) if k.startswith(Prefix)]
+
+        # Tokens are just the last returned key or prefix.
+        after = ContinuationToken or StartAfter
+        if after:
+            keys = keys[bisect_right(keys, after):]
+
+        contents = []
+        prefixes = []
+        last = None
+        res = {'IsTruncated': False}
+
+        for key in keys:
+            prefix = None
+            if Delimiter:
+                pos = key.find(Delimiter, len(Prefix))
+                if pos >= 0:
+                    prefix = key[:pos + len(Delimiter)]
+                    if prefix == last or (after and after.startswith(prefix)):
+                        continue
+
+            if len(contents) + len(prefixes) >= MaxKeys:
+                res['IsTruncated'] = True
+                res['NextContinuationToken'] = last
+                break
+
+            if prefix:
+                prefixes.append(prefix)
+                last = prefix
+            else:
+                data, info = self.store.get(self.bucket, key)
+                contents.append({'Key': key, 'Size': len(data), 'LastModified': info['LastModified'],
+                                 'ETag': info['ETag'], 'StorageClass': info.get('StorageClass', 'STANDARD')})
+                last = key
+
+        if contents:
+            res['Contents'] = contents
+        if prefixes:
+            res['CommonPrefixes'] = [{'Prefix': p} for p in prefixes]
+        res['KeyCount'] = len(contents) + len(prefixes)
+
+        return res
+
+    def create_multipart_upload(self, Key, ContentType=None, Metadata=None, **kwargs):
+        self._wait()
+        upload_id = uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = {'key': Key, 'content_type': ContentType, 'meta': Metadata, 'parts': {}}
+        return {'UploadId': upload_id, 'Key': Key}
+
+    def _get_upload(self, upload_id):
+        with self._lock:
+            upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise _error(404, 'NoSuchUpload', 'The specified upload does not exist.')
+        return upload
+
+    def upload_part(self, Key, UploadId, PartNumber, Body):
+        data = self._read_body(Body)
+        self._wait(len(data))
+        upload = self._get_upload(UploadId)
+        etag = _etag(data)
+
+        with self._lock:
+            upload['parts'][PartNumber] = (etag, data)
+
+        return {'ETag': etag}
+
+    def complete_multipart_upload(self, Key, UploadId, MultipartUpload):
+        self._wait()
+        upload = self._get_upload(UploadId)
+        parts = []
+
+        for p in MultipartUpload['Parts']:
+            part = upload['parts'].get(p['PartNumber'])
+            if part is None or part[0] != p['ETag']:
+                raise _error(400, 'InvalidPart', 'One or more of the specified parts could not be found.')
+            parts.append(part)
+
+        data = b''.join(d for _, d in parts)
+        digest = hashlib.md5(b''.join(hashlib.md5(d).digest() for _, d in parts)).hexdigest()
+        etag = '"{0}-{1}"'.format(digest, len(parts))
+
+        info = dict(self.defaults, ContentType=upload['content_type'] or 'binary/octet-stream',
+                    Metadata=upload['meta'] or {}, ETag=etag, LastModified=datetime.now(UTC).replace(microsecond=0))
+        self.store.put(self.bucket, Key, data, info)
+
+        with self._lock:
+            del self._uploads[UploadId]
+
+        return {'ETag': etag, 'Key': Key}
+
+    def abort_multipart_upload(self, Key, UploadId):
+        self._wait()
+        with self._lock:
+            self._uploads.pop(UploadId, None)
+        return {}
+
+    def pending_uploads(self):
+        """
+            Amount of multipart uploads not completed or aborted, useful for tests.
+        """
+        with self._lock:
+            return len(self._uploads)
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import tempfile
+
+from builtins import object
+from threading import Lock
+from dateutil import parser
+
+'''
+    Local on disk cache for downloaded files, meant to be shared by all processes of the same host.
+    Entries are keyed by bucket and key and store the file ETag so they can be validated with conditional requests.
+    Writes go to a temporary file that is then renamed, so readers never see partial files.
+    Total size is bounded and least recently used files are evicted first, using file modification times.
+    Each process keeps a running estimate of the total size and only scans the folder once it goes over max_size,
+    or every scan_interval seconds to account for files written by other processes.
+'''
+
+
+class LocalFileCache(object):
+    scan_interval = 60  # Max seconds between folder scans, files from other processes are only seen by scans.
+
+    def __init__(self, path, max_size):
+        self.path = path
+        self.max_size = max_size
+
+        # Estimated total size of the data files, None until the first scan.
+        self._size = None
+        self._last_scan = 0
+
+        # Per process counters
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            self._stats[counter] += amount
+
+    def stats(self):
+        """
+            Returns a dict with hits, misses and evictions counters for this process.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _entry_path(self, bucket, key):
+        return os.path.join(self.path, hashlib.sha1((bucket + '/' + key).encode('utf-8')).hexdigest())
+
+    def get(self, bucket, key):
+        """
+            Returns the cached entry info for a file or None (counting a miss) if not cached.
+            Entries are dicts with:
+                etag, content_type, size, last_modified, meta
+        """
+        entry = self._read(bucket, key)
+        if entry is None:
+            self._count('misses')
+
+        return entry
+
+    def miss(self):
+        """
+            Counts a miss for an entry returned by get that can't be used, for example if the file changed.
+        """
+        self._count('misses')
+
+    def _read(self, bucket, key):
+        try:
+            with open(self._entry_path(bucket, key) + '.json', 'r') as f:
+                entry = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        entry['last_modified'] = parser.parse(entry['last_modified'])
+        return entry
+
+    def open(self, entry):
+        """
+            Opens the data of an entry returned by get, counting a hit and refreshing its LRU position.
+            Returns None (and counts a miss) if the file was evicted meanwhile.
+        """
+        try:
+            f = open(os.path.join(self.path, entry['data']), 'rb')
+        except (IOError, OSError):
+            self._count('misses')
+            return None
+
+        try:
+            os.utime(f.name, None)
+        except OSError:
+            pass
+
+        self._count('hits')
+        return f
+
+    def put(self, bucket, key, stream, etag, content_type, size, last_modified, meta):
+        """
+            Copies stream into the cache replacing any previous version of the file.
+            Returns the cached data opened for reading.
+        """
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path, exist_ok=True)
+
+        entry_path = self._entry_path(bucket, key)
+        data_name = os.path.basename(entry_path) + '-' + hashlib.sha1(etag.encode('utf-8')).hexdigest()[:16] + '.data'
+        previous = self._read(bucket, key)
+
+        self._write(os.path.join(self.path, data_name), lambda f: shutil.copyfileobj(stream, f, 64 * 1024))
+        res = open(os.path.join(self.path, data_name), 'rb')
+        written = os.fstat(res.fileno()).st_size
+
+        entry = {
+            'data': data_name,
+            'etag': etag,
+            'content_type': content_type,
+            'size': size,
+            'last_modified': last_modified.isoformat(),
+            'meta': meta
+        }
+
+        self._write(entry_path + '.json', lambda f: f.write(json.dumps(entry).encode('utf-8')))
+
+        if previous:
+            # The previous data is removed or was replaced by the new one.
+            written -= previous['size']
+            if previous['data'] != data_name:
+                self._remove(os.path.join(self.path, previous['data']))
+
+        self._add_size(written)
+        self._evict()
+
+        return res
+
+    def delete(self, bucket, key):
+        """
+            Removes a file from the cache, for example if its data turned out to be invalid.
+        """
+        entry_path = self._entry_path(bucket, key)
+        entry = self._read(bucket, key)
+        self._remove(entry_path + '.json')
+        if entry and self._remove(os.path.join(self.path, entry['data'])):
+            self._add_size(-entry['size'])
+
+    def _write(self, path, writer):
+        # Write to a temp file on the same folder and rename it, which is atomic.
+        fd, temp_path = tempfile.mkstemp(dir=self.path, prefix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                writer(f)
+            os.replace(temp_path, path)
+        except Exception:
+            self._remove(temp_path)
+            raise
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _add_size(self, amount):
+        with self._lock:
+            if self._size is not None:
+                self._size = max(self._size + amount, 0)
+
+    def _evict(self):
+        """
+            Removes least recently used files until the cache is under max_size.
+            The folder is only scanned when the size estimate is over max_size or it is older than scan_interval.
+        """
+        with self._lock:
+            if self._size is not None and self._size <= self.max_size and \
+                    time.time() - self._last_scan < self.scan_interval:
+                return
+
+            # Set before scanning so concurrent misses don't scan too.
+            self._last_scan = time.time()
+
+        files = []
+        total = 0
+
+        for e in os.scandir(self.path):
+            if e.name.endswith('.data'):
+                st = e.stat()
+                files.append((st.st_mtime, st.st_size, e.name))
+                total += st.st_size
+
+        if total > self.max_size:
+            files.sort()
+
+        for _, size, name in files:
+            if total <= self.max_size:
+                break
+
+            # Remove the entry before its data so it is never pointing to a missing file for long.
+            entry_path = os.path.join(self.path, name.split('-', 1)[0] + '.json')
+            entry = self._read_entry_data(entry_path)
+            if entry == name:
+                self._remove(entry_path)
+
+            if self._remove(os.path.join(self.path, name)):
+                self._count('evictions')
+
+            total -= size
+
+        with self._lock:
+            self._size = total
+
+    @staticmethod
+    def _read_entry_data(entry_path):
+        try:
+            with open(entry_path, 'r') as f:
+                return json.load(f)['data']
+        except (IOError, OSError, ValueError, KeyError):
+            return None
@@ -0,0 +1,104 @@
+import re
+
+from builtins import object
+from django.http import StreamingHttpResponse, HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date
+from urllib.parse import quote
+from calendar import timegm
+from zipfile import ZIP_DEFLATED
+from core.exceptions import NotModified, RangeNotSatisfiable
+from core.utils import ZipStream
+
+'''
+    Helpers to serve storage files (or zips of them) through django without downloading them first.
+'''
+
+# Only single byte ranges are forwarded to S3, other range requests get the whole file.
+SINGLE_RANGE_REGEX = re.compile(r'^bytes=(\d+-\d*|-\d+)$')
+
+CHUNK_SIZE = 1024 * 256
+
+
+class FileChunkIterator(object):
+    """
+        Iterates over a file reading chunks into a single reused buffer, so memory doesn't depend on the file size.
+        The file is closed when exhausted or when the server closes the response (eg: client disconnected).
+    """
+
+    def __init__(self, f, chunk_size=CHUNK_SIZE):
+        self.file = f
+        self.chunk_size = chunk_size
+
+    def __iter__(self):
+        buf = bytearray(self.chunk_size)
+        view = memoryview(buf)
+
+        try:
+            while 1:
+                read = self.file.readinto(buf)
+                if not read:
+                    break
+
+                # Django copies each chunk to bytes before sending it, so the buffer can be reused.
+                yield view[:read]
+        finally:
+            self.file.close()
+
+    def close(self):
+        self.file.close()
+
+
+def storage_file_response(request, storage, name, attachment_name=None, chunk_size=CHUNK_SIZE):
+    """
+        Returns a StreamingHttpResponse that streams a S3 storage file to the client.
+        Content-Length, Content-Type, ETag and Last-Modified are forwarded from S3, and the client If-None-Match and
+        single byte Range headers are passed to S3, returning 304, 206 or 416 responses.
+        If attachment_name is given, the file is sent as an attachment with that name.
+
+        Raises NotFound if file not found.
+    """
+    byte_range = request.META.get('HTTP_RANGE', None)
+    if byte_range and not SINGLE_RANGE_REGEX.match(byte_range.replace(' ', '')):
+        byte_range = None
+
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH', None)
+
+    try:
+        f = storage.open_stream(name, byte_range.replace(' ', '') if byte_range else None, if_none_match)
+
+    except NotModified:
+        response = HttpResponseNotModified()
+        response['ETag'] = if_none_match
+        return response
+
+    except RangeNotSatisfiable:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */{0}'.format(storage.head(name)['size'])
+        return response
+
+    response = StreamingHttpResponse(FileChunkIterator(f, chunk_size), status=206 if f.content_range else 200,
+                                     content_type=f.content_type)
+
+    response['Content-Length'] = f.content_length
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = f.etag
+    response['Last-Modified'] = http_date(timegm(f.last_modified.utctimetuple()))
+
+    if f.content_range:
+        response['Content-Range'] = f.content_range
+
+    if attachment_name:
+        response['Content-Disposition'] = "attachment; filename*=UTF-8''{0}".format(quote(attachment_name))
+
+    return response
+
+
+def zip_stream_response(entries, attachment_name, compression=ZIP_DEFLATED):
+    """
+        Returns a StreamingHttpResponse with a zip file of the given (arcname, data) entries, built while it is sent.
+        data can be bytes, a file-like object (such as a S3RawFile) or an iterator of bytes, see ZipStream.
+    """
+    response = StreamingHttpResponse(ZipStream(compression).stream(entries), content_type='application/zip')
+    response['Content-Disposition'] = "attachment; filename*=UTF-8''{0}".format(quote(attachment_name))
+
+    return response
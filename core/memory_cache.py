@@ -0,0 +1,58 @@
+import time
+
+from builtins import object
+from threading import Lock
+from collections import OrderedDict
+
+'''
+    Small thread safe in process LRU cache with optional expiration, for hot values that are expensive to compute
+    but don't need to be shared across processes (use django's cache framework for that).
+'''
+
+
+class LRUCache(object):
+    def __init__(self, max_size, timeout=None):
+        """
+            max_size: max amount of entries, least recently used ones are evicted first.
+            timeout: default entry expiration in seconds, None for no expiration.
+        """
+        self.max_size = max_size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data[key]
+            except KeyError:
+                return default
+
+            if expires is not None and expires <= time.time():
+                del self._data[key]
+                return default
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout=None):
+        timeout = timeout if timeout is not None else self.timeout
+        expires = time.time() + timeout if timeout is not None else None
+
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
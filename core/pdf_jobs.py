@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import logging
+import resource
+import tempfile
+
+from builtins import str
+from builtins import object
+from uuid import uuid4
+from core.process_pool import ProcessPool
+from core.exceptions import OperationError, ExceptionCodes
+from core.utils import StreamingPdfWriter
+
+'''
+    PDF assembly jobs, merging documents with StreamingPdfWriter on a process pool so big documents don't hold
+    web server threads or the GIL. The result is left on a temporary file or uploaded to a storage from the worker.
+    Jobs status is kept on record files, so they can be polled by id from any process of the host.
+'''
+
+logger = logging.getLogger('process_pool')
+
+MESSAGES = {
+    'queue_full': "Too many pending PDF jobs, try again later."
+}
+
+# Storage instances of the worker process, by class.
+_storages = {}
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def _address_space():
+    # Current virtual memory size of the process, 0 if unknown (not Linux).
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[0]) * resource.getpagesize()
+    except (IOError, OSError, ValueError):
+        return 0
+
+
+def _write_record(jobs_dir, record):
+    # Write and rename so the record is never seen partially written.
+    fd, temp_path = tempfile.mkstemp(dir=jobs_dir, prefix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(record, f)
+    os.replace(temp_path, os.path.join(jobs_dir, record['id'] + '.json'))
+
+
+def _run_pdf_job(jobs_dir, record, job_args):
+    # Runs on the worker, the record is written before the job result is sent back.
+    try:
+        _assemble_pdf(*job_args)
+    except Exception as e:
+        record.update(status=FAILED, path=None, error=str(e) or e.__class__.__name__)
+        _write_record(jobs_dir, record)
+        raise
+
+    record['status'] = DONE
+    _write_record(jobs_dir, record)
+
+
+def _get_storage(storage_class):
+    # One instance per class and worker, so its S3 client and transfer pool are reused by every job.
+    storage = _storages.get(storage_class)
+    if storage is None:
+        storage = _storages[storage_class] = storage_class()
+    return storage
+
+
+def _assemble_pdf(documents, outline, info, path, storage_class, name, max_memory):
+    # The memory limit is set on top of what the worker already uses and restored after writing the PDF, so
+    # allocations past it raise MemoryError on this job only. The upload runs without it, since the storage
+    # threads stacks count as address space.
+    previous = resource.getrlimit(resource.RLIMIT_AS)
+    if max_memory:
+        limit = _address_space() + max_memory
+        if previous[1] != resource.RLIM_INFINITY:
+            limit = min(limit, previous[1])
+        resource.setrlimit(resource.RLIMIT_AS, (limit, previous[1]))
+
+    try:
+        try:
+            with open(path, 'wb') as f:
+                writer = StreamingPdfWriter(f)
+
+                for document in documents:
+                    if isinstance(document, (tuple, list)):
+                        writer.add_document(document[0], document[1])
+                    else:
+                        writer.add_document(document)
+
+                if outline:
+                    writer.set_outline(outline)
+                if info:
+                    writer.set_info(info)
+
+                writer.close()
+        finally:
+            if max_memory:
+                resource.setrlimit(resource.RLIMIT_AS, previous)
+
+        if storage_class is not None:
+            with open(path, 'rb') as f:
+                _get_storage(storage_class).upload_file(name, f)
+            os.remove(path)
+
+    except Exception:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+
+class PdfJob(object):
+    """
+        Handle of a PDF job, status is 'pending', 'done' or 'failed'.
+        Once done path has the temporary file with the PDF, to be removed by the caller, or name the storage
+        file it was uploaded to. Once failed error has the failure message.
+        Only handles returned by submit can wait, the ones returned by get are a snapshot of the job record.
+    """
+
+    def __init__(self, job_id, status=PENDING, path=None, name=None, error=None, future=None):
+        self.id = job_id
+        self.status = status
+        self.path = path
+        self.name = name
+        self.error = error
+        self.future = future
+
+    def wait(self, timeout=None):
+        """
+            Waits up to timeout seconds for the job to finish, returns its status.
+        """
+        try:
+            self.future.exception(timeout)
+        except Exception:
+            return self.status
+
+        self._finish()
+        return self.status
+
+    def _finish(self):
+        # Sets the result of the finished future, can be called more than once.
+        e = self.future.exception()
+        if e is None:
+            self.status = DONE
+        else:
+            self.status = FAILED
+            self.error = str(e) or e.__class__.__name__
+            self.path = None  # Removed by the worker
+
+    def to_dict(self):
+        return {'id': self.id, 'status': self.status, 'path': self.path, 'name': self.name, 'error': self.error}
+
+
+class PdfJobService(object):
+    """
+        Merges PDFs on a process pool. Jobs are never run on the calling thread: once max_pending jobs are queued or
+        running new ones are rejected. With 0 workers jobs run on the calling thread without limits (development).
+
+        Each job status is kept on a record file of jobs_dir, so any process of the host can poll it with get.
+    """
+
+    record_timeout = 60 * 60 * 24  # Seconds finished job records are kept.
+
+    def __init__(self, workers=None, max_pending=None, timeout=120, max_memory=1024 * 1024 * 512, spool_dir=None,
+                 jobs_dir=None):
+        """
+            workers, max_pending and timeout are the ProcessPool ones, timeout limits each job seconds.
+            max_memory: max bytes of address space each job can allocate on its worker, None for no limit.
+            spool_dir: folder for the output temporary files, defaults to the system one.
+            jobs_dir: folder for the job records, shared by the processes polling jobs. Defaults to a 'pdf_jobs'
+                folder in the system temporary folder.
+        """
+        self.pool = ProcessPool(workers, max_pending, timeout)
+        self.max_memory = max_memory
+        self.spool_dir = spool_dir
+        self.jobs_dir = jobs_dir or os.path.join(tempfile.gettempdir(), 'pdf_jobs')
+        self._last_cleanup = 0
+
+        if not os.path.isdir(self.jobs_dir):
+            os.makedirs(self.jobs_dir, exist_ok=True)
+
+    def submit(self, documents, outline=None, info=None, storage=None, name=None):
+        """
+            Queues merging documents into a PDF and returns its PdfJob.
+            documents: list of PDF file paths or (path, page indexes) tuples, read by the worker.
+            outline: optional NewPdfWriter.set_outline tree and info: optional NewPdfWriter.set_info dict.
+            storage and name: if given the PDF is uploaded to storage as name instead of left on a temporary file.
+                The worker uses its own instance of the storage class, so it must be configured at class level.
+            Raises OperationError with a 503 status if there are already max_pending jobs.
+        """
+        if time.time() - self._last_cleanup > self.record_timeout / 10:
+            self._last_cleanup = time.time()
+            self.cleanup()
+
+        fd, path = tempfile.mkstemp(dir=self.spool_dir, prefix='pdfjob', suffix='.pdf')
+        os.close(fd)
+
+        job = PdfJob(uuid4().hex, path=None if storage else path, name=name if storage else None)
+        _write_record(self.jobs_dir, job.to_dict())
+
+        args = (list(documents), outline, info, path, type(storage) if storage else None, name)
+
+        if self.pool.workers:
+            job.future = self.pool.try_submit(_run_pdf_job, self.jobs_dir, job.to_dict(), args + (self.max_memory,))
+        else:
+            job.future = self.pool.run_inline(_run_pdf_job, self.jobs_dir, job.to_dict(), args + (None,))
+
+        if job.future is None:
+            os.remove(path)
+            os.remove(self._record_path(job.id))
+            raise OperationError(MESSAGES['queue_full'], ExceptionCodes.jobQueueFull, 503)
+
+        job.future.add_done_callback(lambda future: self._job_done(job, path))
+
+        return job
+
+    def get(self, job_id):
+        """
+            Returns a PdfJob with the current status of job_id, submitted by any process of the host, or None if
+            unknown or expired.
+        """
+        try:
+            with open(self._record_path(job_id), 'r') as f:
+                record = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        return PdfJob(job_id, record['status'], record['path'], record['name'], record['error'])
+
+    def cleanup(self):
+        """
+            Removes the records of jobs finished more than record_timeout seconds ago.
+            Called on submit every record_timeout / 10 seconds.
+        """
+        limit = time.time() - self.record_timeout
+
+        for file_name in os.listdir(self.jobs_dir):
+            if not file_name.endswith('.json'):
+                continue
+
+            path = os.path.join(self.jobs_dir, file_name)
+            try:
+                if os.stat(path).st_mtime < limit:
+                    os.remove(path)
+            except OSError:
+                pass  # Removed by other process
+
+    def _record_path(self, job_id):
+        # Ids come from the API, only accept our own hex ids so they can't point out of jobs_dir.
+        if not job_id or any(c not in '0123456789abcdef' for c in job_id):
+            job_id = 'invalid'
+        return os.path.join(self.jobs_dir, job_id + '.json')
+
+    def _job_done(self, job, path):
+        job._finish()
+
+        if job.status != FAILED:
+            return
+
+        logger.error("PDF job failed.", extra={'extra': job.id + ": " + job.error})
+
+        # Workers write the record and remove the output unless they died (BrokenProcessPool).
+        record = self.get(job.id)
+        if record is not None and record.status == PENDING:
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+                _write_record(self.jobs_dir, job.to_dict())
+            except (IOError, OSError) as e:
+                logger.error("Failed to write PDF job record.", extra={'extra': job.id + ": " + str(e)})
@@ -0,0 +1,144 @@
+import os
+import signal
+import logging
+
+from builtins import object
+from threading import Lock
+from functools import partial
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+
+'''
+    Helper module to offload CPU bound work (image and PDF processing) to worker processes, so it doesn't hold
+    the GIL of the web server threads.
+    Pools are bounded: when max_pending jobs are already queued or running new jobs run on the calling thread
+    instead, so a burst degrades to the previous behavior instead of growing an unbounded queue.
+    Functions and arguments are pickled to the workers, pass file paths instead of big buffers.
+'''
+
+logger = logging.getLogger('process_pool')
+
+# Worker processes of each pool, on each web server process. 0 runs every job on the calling thread.
+POOL_SIZE = settings.PROCESS_POOL_SIZE
+
+
+def _raise_timeout(signum, frame):
+    raise TimeoutError("Job took too long.")
+
+
+def _run_job(fun, args, timeout):
+    # Runs on the main thread of the worker process, so an alarm can interrupt it.
+    # Long C calls (for example a single resize) are only interrupted once they return.
+    if timeout:
+        previous = signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        return fun(*args)
+    finally:
+        if timeout:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+
+
+class ProcessPool(object):
+    def __init__(self, workers=None, max_pending=None, timeout=None):
+        """
+            workers: worker processes, defaults to PROCESS_POOL_SIZE. Started on first use on each process.
+            max_pending: max amount of queued and running jobs, defaults to twice the workers.
+            timeout: seconds after which a job running on a worker fails with TimeoutError, None for no limit.
+                Jobs running on the calling thread are not limited.
+        """
+        self.workers = POOL_SIZE if workers is None else workers
+        self.max_pending = self.workers * 2 if max_pending is None else max_pending
+        self.timeout = timeout
+
+        self._lock = Lock()
+        self._pending = 0
+        self._executor = None
+        self._executor_pid = None
+
+    def _get_executor(self):
+        # Executors can't be used across a fork, each process starts its own.
+        with self._lock:
+            if self._executor_pid != os.getpid():
+                self._executor = None
+                self._executor_pid = os.getpid()
+                self._pending = 0
+
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if executor is None or self._executor is not executor:
+                return
+            self._executor = None
+
+        executor.shutdown(wait=False)
+
+    def submit(self, fun, *args):
+        """
+            Runs fun(*args) on a worker process and returns a Future with its result.
+            fun must be importable by the workers (a module level function).
+            If the pool is saturated fun runs on the calling thread and the returned Future is already done.
+        """
+        future = self.try_submit(fun, *args)
+        return self.run_inline(fun, *args) if future is None else future
+
+    def try_submit(self, fun, *args):
+        """
+            Same as submit but returns None instead of running fun on the calling thread, for jobs too heavy
+            to run inline. Always returns None if the pool has no workers.
+        """
+        executor = self._get_executor() if self.workers else None
+
+        with self._lock:
+            saturated = executor is None or self._pending >= self.max_pending
+            if not saturated:
+                self._pending += 1
+
+        if saturated:
+            return None
+
+        try:
+            future = executor.submit(_run_job, fun, args, self.timeout)
+        except (BrokenProcessPool, RuntimeError):
+            # A worker died (killed for using too much memory for example), start a new pool on next submit.
+            logger.error("Process pool is broken, job not queued.")
+            self._job_done(executor, None)
+            return None
+
+        future.add_done_callback(partial(self._job_done, executor))
+        return future
+
+    def _job_done(self, executor, future):
+        with self._lock:
+            self._pending -= 1
+
+        if future is None or (not future.cancelled() and isinstance(future.exception(), BrokenProcessPool)):
+            self._reset_executor(executor)
+
+    @staticmethod
+    def run_inline(fun, *args):
+        """
+            Runs fun(*args) on the calling thread, returning a done Future.
+        """
+        future = Future()
+
+        try:
+            future.set_result(fun(*args))
+        except Exception as e:
+            future.set_exception(e)
+
+        return future
+
+    def pending(self):
+        """
+            Amount of queued and running jobs on this process pool.
+        """
+        with self._lock:
+            return self._pending
@@ -1,3 +1,6 @@
+import os
+import mmap
+import hashlib
 import time
 import shutil
 import mimetypes
@@ -6,20 +9,26 @@ import logging
 from future import standard_library
 from builtins import str
 from builtins import object
-import boto3
 from django.conf import settings
 from botocore.exceptions import ClientError, BotoCoreError
-from core.exceptions import OperationError, ExceptionCodes, NotFound
+from core.exceptions import OperationError, ExceptionCodes, NotFound, NotModified, RangeNotSatisfiable
 from django.core.files.storage import Storage
 from django.core.files.base import File  # Django's File proxy
 from urllib.parse import quote
-from tempfile import TemporaryFile
+from tempfile import TemporaryFile, SpooledTemporaryFile
 from uuid import uuid4
 from os.path import splitext, basename
 from functools import partial
+from itertools import islice
 from django.utils.deconstruct import deconstructible
 from django.core.files.utils import FileProxyMixin
-from io import BufferedIOBase, BufferedReader, BufferedRandom, BytesIO
+from io import BufferedIOBase, BufferedReader, BufferedRandom, BytesIO, RawIOBase
+from collections import deque, OrderedDict
+from threading import Lock
+from core.thread_pool import ThreadPool
+from core.file_cache import LocalFileCache
+from core.memory_cache import LRUCache
+from core.background_uploads import BackgroundUploader
 
 standard_library.install_aliases()
 s3logger = logging.getLogger('storages.s3')
@@ -28,8 +37,21 @@ S3_KEY = settings.AWS_KEY
 S3_SECRET = settings.AWS_SECRET
 UPLOAD_BUCKET = settings.S3_UPLOAD_BUCKET
 
+# Allows pointing storages to a local fake S3 endpoint (for testing), None uses AWS.
+S3_ENDPOINT_URL = settings.S3_ENDPOINT_URL or None
+
+# In process fake S3 backend, 'memory' or a folder path. See core.fake_s3
+S3_FAKE_BACKEND = settings.S3_FAKE_BACKEND
+
 S3_PREFIX = settings.S3_UPLOAD_PREFIX
 
+# Optional host wide disk cache for downloaded files, shared by all processes.
+S3_CACHE_DIR = settings.S3_CACHE_DIR
+S3_CACHE_MAX_SIZE = settings.S3_CACHE_MAX_SIZE
+
+# Optional host folder to spool files uploaded in background.
+S3_UPLOAD_SPOOL_DIR = settings.S3_UPLOAD_SPOOL_DIR
+
 # Use different prefixes for dev so we have no conflicts
 if settings.DEBUG:
     S3_PREFIX = S3_PREFIX + "_dev"
@@ -58,7 +80,6 @@ class UserProfilePictureFolder(object):
 
 # region ---------- S3 file handling ---------------
 
-
 def safe_S3_path(path):
     """
         converts a path into a safe aws s3 path doing url encoding. This is required when not using boto3 to
@@ -77,6 +98,108 @@ def handle_exception(e, reraise_msg):
     raise OperationError(reraise_msg, ExceptionCodes.s3Error)
 
 
+def get_data_size(data):
+    """
+        Returns the size in bytes of a byte string or file like object, from its current position.
+        File like objects must have a size property or be seekable, otherwise None is returned.
+    """
+
+    if isinstance(data, (bytes, bytearray)):
+        return len(data)
+
+    size = getattr(data, 'size', None)
+    if size is not None:
+        return size
+
+    try:
+        position = data.tell()
+        data.seek(0, 2)
+        size = data.tell() - position
+        data.seek(position)
+        return size
+    except (AttributeError, IOError, OSError, ValueError):
+        return None
+
+
+# Metadata key to store the content hash as '<algorithm>:<hexdigest>'
+HASH_META_KEY = 'content-hash'
+
+
+def get_expected_hash(etag, meta):
+    """
+        Returns (algorithm, hexdigest) that a file content must match, from its metadata hash or its ETag when it
+        is a plain MD5 (not multipart or KMS encrypted). Returns None if unknown.
+    """
+    value = (meta or {}).get(HASH_META_KEY, '')
+    if ':' in value:
+        return tuple(value.split(':', 1))
+
+    etag = (etag or '').strip('"')
+    if len(etag) == 32 and '-' not in etag:
+        return 'md5', etag
+
+    return None
+
+
+def etag_is_md5(response):
+    """
+        Returns False if a S3 response is for an object encrypted with KMS or customer keys (SSE-C), since their
+        ETags are not the MD5 of the content even for single part uploads.
+    """
+    return response.get('ServerSideEncryption') != 'aws:kms' and not response.get('SSECustomerAlgorithm')
+
+
+class HashingReader(object):
+    """
+        File like wrapper that hashes data as it is read, so copy loops can hash without another pass.
+        Seeking back to the start restarts the hash, so it is the hash of the last complete read even if the
+        reader (eg: botocore retries) reads the data more than once.
+    """
+
+    def __init__(self, f, algorithm):
+        self.f = f
+        self.algorithm = algorithm
+        self.hash = hashlib.new(algorithm)
+        self.start = f.tell() if hasattr(f, 'tell') else 0
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.hash.update(data)
+        return data
+
+    def seek(self, offset, whence=0):
+        res = self.f.seek(offset, whence)
+        if self.f.tell() == self.start:
+            self.hash = hashlib.new(self.algorithm)
+        return res
+
+    def tell(self):
+        return self.f.tell()
+
+    def close(self):
+        self.f.close()
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+
+def iter_chunks(data, chunk_size):
+    """
+        Yields chunk_size byte strings from a byte string or file like object until exhausted.
+    """
+
+    if isinstance(data, (bytes, bytearray)):
+        for i in range(0, len(data), chunk_size):
+            yield data[i:i + chunk_size]
+        return
+
+    while 1:
+        buf = data.read(chunk_size)
+        if not buf:
+            break
+        yield buf
+
+
 class S3StreamWrapper(BufferedIOBase):
     """
     boto3 S3 stream wrapper that makes it usable with buffered io classes.
@@ -105,6 +228,7 @@ class TempFileWrapper(BufferedIOBase):
         self.write = raw.write
         self._seek = raw.seek
         self.tell = raw.tell
+        self.fileno = raw.fileno
 
     def readable(self): return True
 
@@ -127,9 +251,12 @@ class S3RawFile(BufferedReader):
     S3 Raw file with buffered reading. File is not seekable but is streamed directly from S3
     Will provide properties from s3:
         name, size, content_type, last_modified, meta
+    And when opened with open_stream also:
+        etag, content_range (for range requests, with content_length being the range size)
     """
 
-    def __init__(self, storage, name, stream, content_type, size, last_modified, meta):
+    def __init__(self, storage, name, stream, content_type, size, last_modified, meta, etag=None,
+                 content_range=None, content_length=None):
         super(S3RawFile, self).__init__(S3StreamWrapper(stream), 64 * 1024)  # Larger buffer since S3 is really fast
         self.storage = storage
 
@@ -138,6 +265,9 @@ class S3RawFile(BufferedReader):
         self.content_type = content_type
         self.last_modified = last_modified
         self.meta = meta
+        self.etag = etag
+        self.content_range = content_range
+        self.content_length = size if content_length is None else content_length
 
     # For some reason can override the name property
     @property
@@ -162,21 +292,22 @@ class S3TempFile(BufferedRandom):
         name, size, content_type, last_modified, meta
     """
 
-    def __init__(self, storage, name, stream, content_type, size, last_modified, meta):
+    def __init__(self, storage, name, stream, content_type, size, last_modified, meta, data=None):
+        """
+        data can be an already filled local file returned by create_local_file, in which case stream is not used.
+        """
         self.storage = storage
+        self._mmap = None
 
-        # Do memory/tempfile spooling here since we now the file size beforehand
-        # so we don't have the overhead of a spooled file with auto roll
+        if data is None:
+            data = self.create_local_file(storage, size)
+            shutil.copyfileobj(stream, data, 64 * 1024)  # Use a bigger buffer size
+
+        data.seek(0)
 
         if size > storage.max_memory_file_size:
-            data = TemporaryFile(mode='w+b', prefix='s3temp')
-            shutil.copyfileobj(stream, data, 64 * 1024)  # Use a bigger buffer size
-            data.seek(0)
             super(S3TempFile, self).__init__(TempFileWrapper(data))
         else:
-            data = BytesIO()
-            shutil.copyfileobj(stream, data, 64 * 1024)  # Use a bigger buffer size
-            data.seek(0)
             super(S3TempFile, self).__init__(data)
 
         self.key = name
@@ -190,6 +321,257 @@ class S3TempFile(BufferedRandom):
     def name(self):
         return self.key
 
+    def to_temp(self):
+        """
+        Already a temporary file, allows using S3TempFile and S3RawFile instances the same way.
+        """
+        return self
+
+    def getbuffer(self):
+        """
+        Returns a memoryview of the whole file without copying it, over the memory buffer or a read only memory map
+        of the temporary file. Slices can be given to hashing, zip, image or pdf functions directly.
+        Views must be released before closing the file.
+        """
+        raw = self.raw
+
+        if isinstance(raw, BytesIO):
+            return raw.getbuffer()
+
+        if self.size == 0:
+            return memoryview(b'')  # Empty files can't be mapped
+
+        if self._mmap is None:
+            self._mmap = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return memoryview(self._mmap)
+
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Views still exported, it will be closed when they are released.
+            self._mmap = None
+
+        super(S3TempFile, self).close()
+
+    @staticmethod
+    def create_local_file(storage, size):
+        """
+        Returns an empty local file to hold size bytes, in memory or a temporary file depending on the storage
+        max_memory_file_size.
+        """
+
+        # Do memory/tempfile spooling here since we now the file size beforehand
+        # so we don't have the overhead of a spooled file with auto roll
+        if size > storage.max_memory_file_size:
+            return TemporaryFile(mode='w+b', prefix='s3temp')
+
+        return BytesIO()
+
+
+class S3SeekableFile(RawIOBase):
+    """
+    Seekable S3 file that only downloads the blocks being read through ranged GETs, keeping the last used blocks
+    in a small LRU cache. Useful for readers that jump around the file such as zip, image or pdf readers.
+    Will provide properties from s3:
+        name, size, content_type, last_modified, meta
+    """
+
+    def __init__(self, storage, name, etag, content_type, size, last_modified, meta):
+        super(S3SeekableFile, self).__init__()
+        self.storage = storage
+
+        self.key = name
+        self.etag = etag
+        self.size = size
+        self.content_type = content_type
+        self.last_modified = last_modified
+        self.meta = meta
+
+        self.block_size = storage.range_block_size
+        self.cache_blocks = storage.range_cache_blocks
+        self._blocks = OrderedDict()
+        self._pos = 0
+
+    # For some reason can override the name property
+    @property
+    def name(self):
+        return self.key
+
+    def readable(self): return True
+
+    def seekable(self): return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        if whence == 0:
+            pos = offset
+        elif whence == 1:
+            pos = self._pos + offset
+        elif whence == 2:
+            pos = self.size + offset
+        else:
+            raise ValueError("Invalid whence value.")
+
+        if pos < 0:
+            raise ValueError("Negative seek position.")
+
+        self._pos = pos
+        return pos
+
+    def readinto(self, b):
+        view = memoryview(b).cast('B')
+        start = self._pos
+        end = min(start + len(view), self.size)
+
+        if end <= start:
+            return 0
+
+        bs = self.block_size
+        first = start // bs
+        pos = start
+
+        for index, block in enumerate(self._get_blocks(first, (end - 1) // bs), first):
+            offset = pos - index * bs
+            chunk = memoryview(block)[offset:offset + end - pos]
+            view[pos - start:pos - start + len(chunk)] = chunk
+            pos += len(chunk)
+
+        self._pos = pos
+        return pos - start
+
+    def readall(self):
+        # Get everything left with a single request instead of block by block.
+        if self._pos >= self.size:
+            return b''
+
+        data = self.storage.download_range(self.key, self._pos, self.size - 1, self.etag)
+        self._pos = self.size
+        return data
+
+    def _get_blocks(self, first, last):
+        """
+        Returns blocks first to last (inclusive), downloading contiguous missing blocks with a single request.
+        """
+        bs = self.block_size
+        cache = self._blocks
+        found = {}
+
+        for index in range(first, last + 1):
+            block = cache.get(index)
+            if block is not None:
+                cache.move_to_end(index)
+                found[index] = block
+
+        index = first
+        while index <= last:
+            if index in found:
+                index += 1
+                continue
+
+            run_end = index
+            while run_end < last and run_end + 1 not in found:
+                run_end += 1
+
+            data = self.storage.download_range(self.key, index * bs, min((run_end + 1) * bs, self.size) - 1,
+                                               self.etag)
+
+            for i in range(index, run_end + 1):
+                found[i] = cache[i] = data[(i - index) * bs:(i - index + 1) * bs]
+
+            index = run_end + 1
+
+        while len(cache) > self.cache_blocks:
+            cache.popitem(last=False)
+
+        return [found[i] for i in range(first, last + 1)]
+
+    def close(self):
+        self._blocks.clear()
+        super(S3SeekableFile, self).close()
+
+
+def _enable_tcp_keepalive(client):
+    """
+        Enables TCP keep-alive on the connections of a client created with an old botocore, which uses a vendored
+        requests session. Options are set on its connection pool managers so every new connection gets them.
+    """
+    import socket
+
+    options = [(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1),  # urllib3 default
+               (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)]
+
+    for adapter in client._endpoint.http_session.adapters.values():
+        adapter.poolmanager.connection_pool_kw['socket_options'] = options
+
+
+class S3ClientFunctions(object):
+    """
+    S3 client and storage bound client functions. Storages create them lazily once per process, since boto3 clients
+    are slow to create and their connection pools can't be shared with forked processes.
+    Low level boto3 clients are thread safe so they are shared by all threads of the process.
+    """
+
+    def __init__(self, storage):
+        import boto3
+        from botocore.client import Config
+
+        self.pid = os.getpid()
+
+        config = storage.get_client_config()
+        try:
+            client_config = Config(**config)
+            pool_keepalive = False
+        except TypeError:
+            # botocore versions before 1.27 (as the pinned one) have no tcp_keepalive option.
+            pool_keepalive = config.pop('tcp_keepalive', False)
+            client_config = Config(**config)
+
+        # Default boto3 session is not thread safe, use a new one.
+        self.client = boto3.session.Session().client(
+            's3',
+            aws_access_key_id=storage.s3_key,
+            aws_secret_access_key=storage.s3_secret,
+            endpoint_url=storage.endpoint_url,
+            config=client_config
+        )
+
+        if pool_keepalive:
+            _enable_tcp_keepalive(self.client)
+
+        bucket = storage.s3_bucket
+
+        # Save function locally to improve performance
+        self.generate_signed_url = partial(self.client.generate_presigned_url, 'get_object')
+
+        self.put_object = partial(
+            self.client.put_object,
+            ACL=storage.acl,
+            Bucket=bucket,
+            CacheControl=storage.cache_control,
+            StorageClass=storage.storage_class
+
+        )
+        self.get_object = partial(self.client.get_object, Bucket=bucket)
+        self.delete_object = partial(self.client.delete_object, Bucket=bucket)
+        self.delete_objects = partial(self.client.delete_objects, Bucket=bucket)
+        self.head_object = partial(self.client.head_object, Bucket=bucket)
+        self.list_objects = partial(self.client.list_objects_v2, Bucket=bucket)
+        self.create_multipart_upload = partial(
+            self.client.create_multipart_upload,
+            ACL=storage.acl,
+            Bucket=bucket,
+            CacheControl=storage.cache_control,
+            StorageClass=storage.storage_class
+        )
+        self.upload_part = partial(self.client.upload_part, Bucket=bucket)
+        self.complete_multipart_upload = partial(self.client.complete_multipart_upload, Bucket=bucket)
+        self.abort_multipart_upload = partial(self.client.abort_multipart_upload, Bucket=bucket)
+
 
 @deconstructible
 class BaseS3Storage(Storage):
@@ -213,59 +595,397 @@ class BaseS3Storage(Storage):
     default_content_type = "application/octet-stream"
 
     url_expiration = 60 * 60 * 24  # 1 day in seconds. Can be either None or False for no expiration links.
+    # HEAD results are cached for head_cache_timeout seconds to avoid repeated requests for the same file in a burst.
+    # Files not found are not cached, so files uploaded by other processes (eg: content addressed) are seen at once,
+    # but changes and deletes made by them might not be seen during that time. 0 disables it.
+    head_cache_timeout = 5
+    head_cache_size = 1024
+
+    # Signed urls are cached and reused until this fraction of their expiration has elapsed. 0 disables the cache.
+    url_cache_refresh = 0.5
+    url_cache_size = 1024
     max_memory_file_size = 1024 * 1024 * 10  # 10mb max in memory size for downloaded files, will fallback to temp file
 
+    endpoint_url = S3_ENDPOINT_URL
+
+    # Use a fake in process backend instead of S3 ('memory' or a folder path), credentials are not required.
+    # Latency (seconds per request) and bandwidth (bytes per second) can be simulated for benchmarks.
+    fake_s3 = S3_FAKE_BACKEND
+    fake_s3_latency = 0
+    fake_s3_bandwidth = None
+
+    # ----- Connections -----
+    # Clients are created on first use on each process, with a connection pool shared by all its threads.
+    # Make sure the pool is big enough for the web server threads plus the transfer workers.
+    max_pool_connections = 20
+    tcp_keepalive = None  # True to enable TCP keep-alive on S3 connections.
+
+    # ----- Transfers -----
+    # Parallel transfers run on a per storage thread pool, created on first use.
+    transfer_workers = 4
+
+    # Files bigger than the threshold are uploaded using S3 multipart uploads, with parts uploaded in parallel.
+    multipart_threshold = 1024 * 1024 * 16  # 16mb
+    multipart_chunk_size = 1024 * 1024 * 8  # 8mb, S3 requires at least 5mb for every part but the last one.
+    multipart_max_parts = 10000  # S3 limit, chunk size is increased for huge files.
+    multipart_retries = 3  # Retries for each failed part before aborting the whole upload.
+    multipart_retry_delay = 0.5  # Seconds, multiplied by attempt number.
+
+    # Uploads are verified with the returned ETags and downloads with the file hash metadata or its ETag, hashing
+    # the data while it is copied. ETags of KMS or customer key encrypted files are not MD5s, so only their hash
+    # metadata (content addressed files) is verified.
+    verify_transfers = True
+    hash_algorithm = 'md5'  # For content addressed files, any hashlib algorithm
+
+    delete_batch_size = 1000  # S3 limit of files for each DeleteObjects request.
+
+    # When set, save spools files to this folder and uploads them on a background pool, returning immediately.
+    # Pending uploads left by dead processes are resumed when the uploader starts, on the first save or on startup
+    # (see resume_background_uploads). Use upload_status to check them.
+    background_upload_dir = None
+    background_upload_workers = 2
+    background_upload_max_pending = 100  # Per process, save raises OperationError (503) when reached.
+
+    # Files bigger than the threshold are downloaded (when not streamed) with concurrent ranged GETs.
+    # The first request always asks for download_threshold bytes, so smaller files take a single GET.
+    download_threshold = 1024 * 1024 * 8  # 8mb
+    download_chunk_size = 1024 * 1024 * 8  # 8mb
+
+    # Seekable files download blocks of range_block_size, keeping the last range_cache_blocks in memory.
+    range_block_size = 1024 * 256  # 256kb
+    range_cache_blocks = 16
+
+    # ----- Thumbnails -----
+    # Content addressed thumbnails of stored images (see core.thumbnails.ThumbnailCache), used by thumbnail_url.
+    thumbnail_prefix = S3_PREFIX + '/thumbnails' if S3_PREFIX else 'thumbnails'
+    thumbnail_class = None  # ImageThumbnail subclass, importable by process workers. Defaults to ImageThumbnail.
+    thumbnail_workers = None  # Process pool workers to create thumbnails, None for PROCESS_POOL_SIZE.
+    thumbnail_cache_dir = None  # Optional host folder to cache thumbnails, in front of S3.
+    thumbnail_cache_max_size = 1024 * 1024 * 128  # 128mb
+
+    # LocalFileCache instance. When set, downloads are always done to the cache (and never streamed) and
+    # cached files are validated with conditional GETs, so only changed files are downloaded again.
+    local_cache = None
+
     # ---------------------
 
     # The storage class can not have sensitive data on its constructor because it goes into migrations otherwise.
     def __init__(self):
 
-        if not self.s3_key or not self.s3_secret or not self.s3_bucket:
+        if self.fake_s3:
+            self.s3_bucket = self.s3_bucket or 'fake'
+
+        elif not self.s3_key or not self.s3_secret or not self.s3_bucket:
             raise ValueError("Missing S3 credentials")
 
         # Store locally for faster lookups
         self.s3_bucket = self.s3_bucket
 
-        self.s3_client = boto3.client('s3', aws_access_key_id=self.s3_key, aws_secret_access_key=self.s3_secret)
-
-        # Save function locally to improve performance
-        self._generate_signed_url = partial(self.s3_client.generate_presigned_url, 'get_object')
-
-        self._put_object = partial(
-            self.s3_client.put_object,
-            ACL=self.acl,
-            Bucket=self.s3_bucket,
-            CacheControl=self.cache_control,
-            StorageClass=self.storage_class
+        self._client_lock = Lock()
+        self._s3 = None
+        self._transfer_pool = None
+        self._transfer_pool_pid = None
+        self._background_uploader = None
+        self._thumbnail_cache = None
 
-        )
-        self._get_object = partial(self.s3_client.get_object, Bucket=self.s3_bucket)
-        self._delete_object = partial(self.s3_client.delete_object, Bucket=self.s3_bucket)
-        self._head_object = partial(self.s3_client.head_object, Bucket=self.s3_bucket)
         self._public_url = u"https://{0}.s3.amazonaws.com/".format(self.s3_bucket) + "{0}"
 
+        self._head_cache = LRUCache(self.head_cache_size, self.head_cache_timeout) \
+            if self.head_cache_timeout and self.head_cache_size else None
+        self._url_cache = LRUCache(self.url_cache_size) if self.url_cache_refresh and self.url_cache_size else None
+
         if self.url_expiration:
             self._get_url = partial(self.get_private_url, expires=self.url_expiration)
 
         else:
             self._get_url = self.get_public_url
 
-    def upload_file(self, name, data, meta=None):
+    @property
+    def s3(self):
+        """
+            S3ClientFunctions for this storage, created on first use on each process.
+        """
+        s3 = self._s3
+
+        if s3 is None or s3.pid != os.getpid():
+            with self._client_lock:
+                s3 = self._s3
+                if s3 is None or s3.pid != os.getpid():
+                    s3 = self._s3 = self.create_client_functions()
+
+        return s3
+
+    @property
+    def s3_client(self):
+        return self.s3.client
+
+    def create_client_functions(self):
+        """
+            Returns a new S3ClientFunctions, or FakeS3ClientFunctions when using a fake backend.
+        """
+        if self.fake_s3:
+            from core.fake_s3 import FakeS3ClientFunctions, get_store
+            return FakeS3ClientFunctions(self, get_store(self.fake_s3), self.fake_s3_latency, self.fake_s3_bandwidth)
+
+        return S3ClientFunctions(self)
+
+    def get_client_config(self):
+        """
+            Returns the botocore Config keyword arguments used to create the S3 client.
+        """
+        config = {'max_pool_connections': self.max_pool_connections}
+
+        if self.tcp_keepalive is not None:
+            config['tcp_keepalive'] = self.tcp_keepalive
+
+        return config
+
+    def get_transfer_pool(self):
+        """
+            Returns the thread pool used for parallel transfers, created on first use on each process.
+        """
+        if self._transfer_pool is None or self._transfer_pool_pid != os.getpid():
+            with self._client_lock:
+                if self._transfer_pool is None or self._transfer_pool_pid != os.getpid():
+                    self._transfer_pool = ThreadPool(workers=self.transfer_workers)
+                    self._transfer_pool_pid = os.getpid()
+
+        return self._transfer_pool
+
+    def get_background_uploader(self):
+        """
+            Returns the BackgroundUploader for this storage, created on first use on each process.
+        """
+        uploader = self._background_uploader
+
+        if uploader is None or uploader.pid != os.getpid():
+            with self._client_lock:
+                uploader = self._background_uploader
+                if uploader is None or uploader.pid != os.getpid():
+                    uploader = self._background_uploader = BackgroundUploader(
+                        self, self.background_upload_dir, self.background_upload_workers,
+                        self.background_upload_max_pending
+                    )
+
+        return uploader
+
+    def get_thumbnail_cache(self):
+        """
+            Returns the ThumbnailCache for this storage, created on first use.
+        """
+        if self._thumbnail_cache is None:
+            from core.utils import ImageThumbnail
+            from core.thumbnails import ThumbnailCache, ThumbnailService
+
+            with self._client_lock:
+                if self._thumbnail_cache is None:
+                    thumbnail_class = self.thumbnail_class or ImageThumbnail
+                    local_cache = LocalFileCache(self.thumbnail_cache_dir, self.thumbnail_cache_max_size) \
+                        if self.thumbnail_cache_dir else None
+
+                    self._thumbnail_cache = ThumbnailCache(
+                        self, self.thumbnail_prefix, thumbnail_class, local_cache,
+                        ThumbnailService(thumbnail_class, workers=self.thumbnail_workers)
+                    )
+
+        return self._thumbnail_cache
+
+    def thumbnail_url(self, name, size, create=False):
+        """
+            Returns the url of the size thumbnail of a stored image, without creating it again if it already
+            exists for the same content. If it doesn't exist returns None, or creates it if create is True.
+
+            Raises NotFound if the image is not found, and ValueError if create is True and it's not a valid image.
+        """
+        cache = self.get_thumbnail_cache()
+        source_hash = cache.source_hash(name)
+        url = cache.url(source_hash, size)
+
+        if url is None and create:
+            data = self.download_file(name, stream=False)
+            try:
+                cache.create(data, [size], source_hash)
+            finally:
+                data.close()
+
+            url = cache.url(source_hash, size)
+
+        return url
+
+    def upload_status(self, name):
+        """
+            Returns 'pending', 'done' or 'failed' for files saved in background by this process, None if unknown.
+        """
+        if not self.background_upload_dir:
+            return None
+
+        return self.get_background_uploader().status(name)
+
+    def upload_file(self, name, data, meta=None, progress=None):
         """
             Uploads a file to S3 given its complete name and this storage bucket.
             data can be either a file like object or a byte string
             meta should be a k,v dict
+            progress can be a callable receiving (uploaded_bytes, total_bytes) after each uploaded part.
+
+            Files bigger than multipart_threshold are uploaded with a parallel multipart upload.
         """
+        content_type = mimetypes.guess_type(name, strict=False)[0] or self.default_content_type
+        size = get_data_size(data)
+
         try:
-            self._put_object(
-                Body=data,
-                ContentType=mimetypes.guess_type(name, strict=False)[0] or self.default_content_type,
-                Key=name,
-                Metadata=meta or {},
-            )
+            if size is not None and size > self.multipart_threshold:
+                self._upload_multipart(name, data, size, content_type, meta, progress)
+            else:
+                # Hash while botocore reads the body, unless the caller already knows it.
+                expected = get_expected_hash(None, meta) if self.verify_transfers else None
+                reader = None
+
+                if self.verify_transfers and (not expected or expected[0] != 'md5'):
+                    if isinstance(data, str):
+                        data = data.encode('utf-8')
+                    if isinstance(data, (bytes, bytearray)):
+                        data = BytesIO(data)
+                    reader = data = HashingReader(data, 'md5')
+
+                res = self.s3.put_object(
+                    Body=data,
+                    ContentType=content_type,
+                    Key=name,
+                    Metadata=meta or {},
+                )
+
+                if self.verify_transfers:
+                    self._verify_stored(name, reader.hexdigest() if reader else expected[1], res)
+
+                if progress:
+                    progress(size, size)
+
         except Exception as e:
             handle_exception(e, "Failed to upload file.")
 
+        finally:
+            # Once stored (or failed), so a HEAD cached while uploading is not kept.
+            self._forget_head(name)
+
+    def _upload_multipart(self, name, data, size, content_type, meta, progress):
+        """
+            Uploads data in parts on the transfer pool, keeping at most transfer_workers parts in memory.
+            The upload is aborted on any error so no orphan parts are left (and billed) on S3.
+        """
+
+        chunk_size = max(self.multipart_chunk_size, -(-size // self.multipart_max_parts))
+        upload_id = self.s3.create_multipart_upload(Key=name, ContentType=content_type, Metadata=meta or {})['UploadId']
+
+        pool = self.get_transfer_pool()
+        pending = deque()
+        parts = []
+        digests = []
+        uploaded = 0
+
+        try:
+            for number, chunk in enumerate(iter_chunks(data, chunk_size), 1):
+                pending.append(pool.apply_async(self._upload_part_retry, (name, upload_id, number, chunk)))
+
+                # Wait for the oldest part so memory is bounded by the amount of in flight parts.
+                if len(pending) >= self.transfer_workers:
+                    part, part_size, digest = pending.popleft().get()
+                    parts.append(part)
+                    digests.append(digest)
+                    uploaded += part_size
+                    if progress:
+                        progress(uploaded, size)
+
+            while pending:
+                part, part_size, digest = pending.popleft().get()
+                parts.append(part)
+                digests.append(digest)
+                uploaded += part_size
+                if progress:
+                    progress(uploaded, size)
+
+            res = self.s3.complete_multipart_upload(Key=name, UploadId=upload_id, MultipartUpload={'Parts': parts})
+
+        except Exception:
+            # Let running parts finish before aborting, otherwise they could be stored after the abort.
+            for res in pending:
+                res.wait()
+
+            try:
+                self.s3.abort_multipart_upload(Key=name, UploadId=upload_id)
+            except Exception as e:
+                s3logger.error("Failed to abort multipart upload.", extra={'extra': name + ": " + str(e)})
+
+            raise
+
+        # Multipart ETags are the MD5 of the parts MD5s and the amount of parts.
+        if self.verify_transfers:
+            self._verify_stored(name, u"{0}-{1}".format(hashlib.md5(b''.join(digests)).hexdigest(), len(digests)),
+                                res)
+
+    def _upload_part_retry(self, name, upload_id, number, chunk):
+        """
+            Uploads a single part retrying up to multipart_retries times.
+            Returns the part info required to complete the upload, the part size and its MD5 digest.
+        """
+        attempt = 0
+        md5 = hashlib.md5(chunk)
+
+        while 1:
+            try:
+                res = self.s3.upload_part(Key=name, UploadId=upload_id, PartNumber=number, Body=chunk)
+
+                if self.verify_transfers and etag_is_md5(res):
+                    self._verify_hash(name, md5.hexdigest(), res['ETag'])
+
+                return {'ETag': res['ETag'], 'PartNumber': number}, len(chunk), md5.digest()
+            except (ClientError, BotoCoreError, IOError) as e:
+                attempt += 1
+                if attempt > self.multipart_retries:
+                    raise
+
+                s3logger.warn("Retrying failed part upload.", extra={'extra': "{0} #{1}: {2}".format(name, number, e)})
+                time.sleep(self.multipart_retry_delay * attempt)
+
+    @staticmethod
+    def _verify_hash(name, expected, actual):
+        """
+            Raises IOError if a transferred file hash or ETag doesn't match the expected one.
+        """
+        actual = actual.strip('"')
+        if actual != expected:
+            s3logger.error("Transfer verification failed.",
+                           extra={'extra': u"{0}: expected {1} got {2}".format(name, expected, actual)})
+            raise IOError(u"Hash mismatch for {0}.".format(name))
+
+    def _verify_stored(self, name, expected, response):
+        """
+            Verifies the ETag of an upload response as _verify_hash, deleting the file if it doesn't match so it's
+            never served. Encrypted files (see etag_is_md5) are not verified, their ETags never match.
+        """
+        if not etag_is_md5(response):
+            return
+
+        try:
+            self._verify_hash(name, expected, response['ETag'])
+        except IOError:
+            try:
+                self.s3.delete_object(Key=name)
+            except Exception as e:
+                s3logger.error("Failed to delete unverified file.", extra={'extra': name + ": " + str(e)})
+            raise
+
+    def _hashing_body(self, result):
+        """
+            Returns the body of a get_object result wrapped to hash it while read, and the expected hash, if the
+            file can be verified.
+        """
+        etag = result['ETag'] if etag_is_md5(result) else None
+        expected = get_expected_hash(etag, result['Metadata']) if self.verify_transfers else None
+        if expected is None:
+            return result['Body'], None
+        return HashingReader(result['Body'], expected[0]), expected
+
     def download_file(self, name, stream=True):
         """
             Downloads a file from s3 returning a S3RawFile or S3TempFile instance
@@ -275,21 +995,23 @@ class BaseS3Storage(Storage):
                     connection
                 if False, file is streamed directly from S3 but is not seekable and connection remains open                
 
+            Temporary downloads of files bigger than download_threshold use concurrent ranged GETs.
+            If the storage has a local_cache, a S3TempFile is always returned.
+
             The caller is responsable to correctly close the returned data object
 
             Raises NotFound if file not found due to 404 code.
         """
 
         try:
-            result = self._get_object(Key=name)
-
-            if stream:
+            if self.local_cache is not None:
+                res = self._download_cached(name)
+            elif stream:
+                result = self.s3.get_object(Key=name)
                 res = S3RawFile(self, name, result['Body'], result["ContentType"], result["ContentLength"],
                                 result["LastModified"], result["Metadata"])
             else:
-                res = S3TempFile(self, name, result['Body'], result["ContentType"], result["ContentLength"],
-                                 result["LastModified"], result["Metadata"])
-                result["Body"].close()
+                res = self._download_temp(name)
 
             return res
 
@@ -304,6 +1026,218 @@ class BaseS3Storage(Storage):
         except Exception as e:
             handle_exception(e, "Failed to download file.")
 
+    def _download_cached(self, name):
+        """
+            Downloads a file through the local cache, returning a S3TempFile backed by the cached data.
+        """
+        cache = self.local_cache
+        entry = cache.get(self.s3_bucket, name)
+        result = None
+
+        if entry:
+            try:
+                result = self.s3.get_object(Key=name, IfNoneMatch=entry['etag'])
+                cache.miss()  # Changed since cached
+            except ClientError as e:
+                if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', None) != 304:
+                    raise
+
+                # Not modified, use the cached version unless it was evicted meanwhile.
+                data = cache.open(entry)
+                if data is not None:
+                    return self._cached_temp_file(name, data, entry['content_type'], entry['size'],
+                                                  entry['last_modified'], entry['meta'])
+
+        if result is None:
+            result = self.s3.get_object(Key=name)
+
+        body, expected = self._hashing_body(result)
+        try:
+            data = cache.put(self.s3_bucket, name, body, result['ETag'], result['ContentType'],
+                             result['ContentLength'], result['LastModified'], result['Metadata'])
+        finally:
+            body.close()
+
+        if expected:
+            try:
+                self._verify_hash(name, expected[1], body.hexdigest())
+            except IOError:
+                data.close()
+                cache.delete(self.s3_bucket, name)
+                raise
+
+        return self._cached_temp_file(name, data, result['ContentType'], result['ContentLength'],
+                                      result['LastModified'], result['Metadata'])
+
+    def _cached_temp_file(self, name, data, content_type, size, last_modified, meta):
+        # Cached files are read only, small ones are copied to memory like regular temp files.
+        if size <= self.max_memory_file_size:
+            cached = data
+            try:
+                data = BytesIO(cached.read())
+            finally:
+                cached.close()
+
+        return S3TempFile(self, name, None, content_type, size, last_modified, meta, data=data)
+
+    def _download_temp(self, name):
+        """
+            Downloads a file into a S3TempFile. The first GET asks for the first download_threshold bytes and,
+            if the file is bigger, the remaining ranges are downloaded concurrently on the transfer pool.
+        """
+        try:
+            result = self.s3.get_object(Key=name, Range='bytes=0-{0}'.format(self.download_threshold - 1))
+        except ClientError as e:
+            # Empty files can't satisfy any range.
+            if e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', None) != 416:
+                raise
+            result = self.s3.get_object(Key=name)
+
+        body = result['Body']
+
+        # Content range has the form 'bytes 0-999/1234', it won't be present if the whole file was returned.
+        content_range = result.get('ContentRange', None)
+        size = int(content_range.rsplit('/', 1)[1]) if content_range else result['ContentLength']
+
+        if not content_range or size <= self.download_threshold:
+            # The whole file is on this response so it can be verified while copied.
+            body, expected = self._hashing_body(result)
+            try:
+                res = S3TempFile(self, name, body, result["ContentType"], size, result["LastModified"],
+                                 result["Metadata"])
+            finally:
+                body.close()
+
+            if expected:
+                try:
+                    self._verify_hash(name, expected[1], body.hexdigest())
+                except IOError:
+                    res.close()
+                    raise
+
+            return res
+
+        data = S3TempFile.create_local_file(self, size)
+        lock = Lock()
+
+        try:
+            # Pin the version with the ETag so a concurrent overwrite fails instead of mixing contents.
+            pool = self.get_transfer_pool()
+            pending = [
+                pool.apply_async(self._download_range, (name, result['ETag'], data, lock, start,
+                                                        min(start + self.download_chunk_size, size) - 1))
+                for start in range(self.download_threshold, size, self.download_chunk_size)
+            ]
+
+            # Meanwhile read the first range from the already open response.
+            try:
+                self._write_range(data, lock, 0, body.read())
+            finally:
+                body.close()
+
+            for res in pending:
+                res.get()
+
+        except Exception:
+            data.close()
+            raise
+
+        return S3TempFile(self, name, None, result["ContentType"], size, result["LastModified"], result["Metadata"],
+                          data=data)
+
+    def _download_range(self, name, etag, data, lock, start, end):
+        """
+            Downloads the start-end (inclusive) byte range of a file writing it at its offset on data.
+        """
+        self._write_range(data, lock, start, self._get_range(name, start, end, etag))
+
+    def _get_range(self, name, start, end, etag=None):
+        kwargs = {'IfMatch': etag} if etag else {}
+        result = self.s3.get_object(Key=name, Range='bytes={0}-{1}'.format(start, end), **kwargs)
+        try:
+            buf = result['Body'].read()
+        finally:
+            result['Body'].close()
+
+        if len(buf) != end - start + 1:
+            raise IOError("Incomplete range download.")
+
+        return buf
+
+    @staticmethod
+    def _write_range(data, lock, start, buf):
+        with lock:
+            data.seek(start)
+            data.write(buf)
+
+    def open_stream(self, name, byte_range=None, if_none_match=None):
+        """
+            Opens a S3RawFile streaming the file from S3, like download_file with stream=True but allowing:
+                byte_range: http Range header value (eg: 'bytes=0-99'), to get only part of the file.
+                if_none_match: ETag the caller already has.
+            The returned file also has etag, content_range and content_length properties.
+            Local cache is not used.
+
+            Raises NotFound if file not found, NotModified if if_none_match matches the file ETag and
+            RangeNotSatisfiable if the range is not valid for the file.
+        """
+        kwargs = {}
+        if byte_range:
+            kwargs['Range'] = byte_range
+        if if_none_match:
+            kwargs['IfNoneMatch'] = if_none_match
+
+        try:
+            result = self.s3.get_object(Key=name, **kwargs)
+        except ClientError as e:
+            status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', None)
+            if status == 304:
+                raise NotModified()
+            if status == 404:
+                raise NotFound("File not found.")
+            if status == 416:
+                raise RangeNotSatisfiable()
+
+            handle_exception(e, "Failed to download file.")
+        except Exception as e:
+            handle_exception(e, "Failed to download file.")
+
+        content_range = result.get('ContentRange', None)
+        size = int(content_range.rsplit('/', 1)[1]) if content_range else result['ContentLength']
+
+        return S3RawFile(self, name, result['Body'], result["ContentType"], size, result["LastModified"],
+                         result["Metadata"], etag=result['ETag'], content_range=content_range,
+                         content_length=result['ContentLength'])
+
+    def download_range(self, name, start, end, etag=None):
+        """
+            Downloads the start-end (inclusive) byte range of a file returning a byte string.
+            If etag is given, the request fails if the file has changed.
+
+            Raises NotFound if file not found due to 404 code.
+        """
+        try:
+            return self._get_range(name, start, end, etag)
+        except ClientError as e:
+            if 'ResponseMetadata' in e.response:
+                status = e.response['ResponseMetadata'].get('HTTPStatusCode', None)
+                if status == 404:
+                    raise NotFound("File not found.")
+
+            handle_exception(e, "Failed to download file range.")
+        except Exception as e:
+            handle_exception(e, "Failed to download file range.")
+
+    def download_file_seekable(self, name):
+        """
+            Returns a S3SeekableFile for the given file. Only a HEAD request is done here, the file blocks are
+            downloaded when read. Use it instead of a temporary download when only parts of a big file are needed.
+
+            Raises NotFound if file not found due to 404 code.
+        """
+        d = self.head_file(name)
+        return S3SeekableFile(self, name, d['etag'], d['content_type'], d['size'], d['last_modified'], d['meta'])
+
     def get_public_url(self, name):
         """
             No checks are done if file doesn't exist.
@@ -314,18 +1248,95 @@ class BaseS3Storage(Storage):
     def get_private_url(self, name, expires):
         """
             Signed url for private files with expires in seconds.
+            Urls are reused until url_cache_refresh of expires has elapsed, so they remain valid for the rest of
+            the time. Signing is slow and repeated urls are also cached by browsers.
         """
-        return self._generate_signed_url(Params={"Bucket": self.s3_bucket, "Key": name}, ExpiresIn=expires)
+        if self._url_cache is None:
+            return self.s3.generate_signed_url(Params={"Bucket": self.s3_bucket, "Key": name}, ExpiresIn=expires)
+
+        key = (name, expires)
+        url = self._url_cache.get(key)
+
+        if url is None:
+            url = self.s3.generate_signed_url(Params={"Bucket": self.s3_bucket, "Key": name}, ExpiresIn=expires)
+            self._url_cache.set(key, url, expires * self.url_cache_refresh)
+
+        return url
 
     def delete_file(self, name):
         """
             Deletes a file. The s3 service doesn't seem to raise errors if file not found.
         """
+        self._forget_head(name)
+
         try:
-            self._delete_object(Key=name)
+            self.s3.delete_object(Key=name)
         except Exception as e:
             handle_exception(e, "Failed to delete file.")
 
+    def delete_many(self, names):
+        """
+            Deletes many files using DeleteObjects requests of delete_batch_size files, run concurrently on the
+            transfer pool. names can be any iterable and it is consumed lazily.
+            Returns a dict with every name and None if deleted or an error message otherwise.
+            As with delete_file, files not found are considered deleted.
+        """
+        return dict(self._iter_delete_results(names))
+
+    def delete_prefix(self, prefix):
+        """
+            Deletes all files whose name starts with prefix, listing and deleting a page of files at a time.
+            Returns a dict with the names that failed to be deleted and their error messages.
+        """
+        return {k: v for k, v in self._iter_delete_results(f['name'] for f in self.iter_files(prefix)) if v}
+
+    def _iter_delete_results(self, names):
+        """
+            Deletes names in batches yielding (name, error) tuples, keeping at most transfer_workers batches in flight.
+        """
+        pool = self.get_transfer_pool()
+        pending = deque()
+        names = iter(names)
+
+        try:
+            while 1:
+                batch = list(islice(names, self.delete_batch_size))
+                if not batch:
+                    break
+
+                pending.append(pool.apply_async(self._delete_batch, (batch,)))
+
+                if len(pending) >= self.transfer_workers:
+                    for res in pending.popleft().get():
+                        yield res
+
+            while pending:
+                for res in pending.popleft().get():
+                    yield res
+
+        finally:
+            # Don't leave deletes running in the background if the caller stopped or listing failed.
+            for res in pending:
+                res.wait()
+
+    def _delete_batch(self, names):
+        for name in names:
+            self._forget_head(name)
+
+        try:
+            # Quiet mode only returns the errors.
+            result = self.s3.delete_objects(Delete={'Objects': [{'Key': k} for k in names], 'Quiet': True})
+        except Exception as e:
+            s3logger.error("Failed to delete files.", extra={'extra': str(e)})
+            return [(k, str(e)) for k in names]
+
+        errors = {d['Key']: u"{0}: {1}".format(d.get('Code', ''), d.get('Message', ''))
+                  for d in result.get('Errors', ())}
+        if errors:
+            s3logger.error("Failed to delete files.", extra={'extra': str(errors)})
+
+        return [(k, errors.get(k, None)) for k in names]
+
     def head_file(self, name):
         """
             Performs a HEAD request to determine if a file exists and get its metadata.
@@ -336,18 +1347,26 @@ class BaseS3Storage(Storage):
                 size
                 last_modified : datetime
                 meta : object meta        
+                etag
 
             }
 
             Raises NotFound if file not found due to 404 code.
         """
+        cache = self._head_cache
+        cached = cache.get(name) if cache is not None else None
+
+        if cached is not None:
+            return dict(cached)
+
         try:
-            d = self._head_object(Key=name)
-            return {
+            d = self.s3.head_object(Key=name)
+            res = {
                 'content_type': d['ContentType'],
                 'size': d["ContentLength"],
                 'last_modified': d['LastModified'],
-                'meta': d['Metadata']
+                'meta': d['Metadata'],
+                'etag': d['ETag']
 
             }
         except ClientError as e:
@@ -360,6 +1379,106 @@ class BaseS3Storage(Storage):
         except Exception as e:
             handle_exception(e, "Failed to head file.")
 
+        if cache is not None:
+            cache.set(name, res)
+
+        return dict(res)
+
+    def _forget_head(self, name):
+        if self._head_cache is not None:
+            self._head_cache.delete(name)
+
+    def head_many(self, names):
+        """
+            Performs head_file for many files concurrently on the transfer pool.
+            Returns a dict with each name and its head_file result, or a NotFound instance if not found.
+            Other errors are raised.
+        """
+        pool = self.get_transfer_pool()
+        pending = [(name, pool.apply_async(self._head_or_not_found, (name,))) for name in set(names)]
+
+        return {name: res.get() for name, res in pending}
+
+    def exists_many(self, names):
+        """
+            Returns a dict with each name and True if the file exists, checked concurrently.
+        """
+        return {k: not isinstance(v, NotFound) for k, v in self.head_many(names).items()}
+
+    def _head_or_not_found(self, name):
+        try:
+            return self.head_file(name)
+        except NotFound as e:
+            return e
+
+    def _iter_list_pages(self, prefix, delimiter=None, page_size=1000):
+        """
+            Yields list_objects_v2 result pages following continuation tokens.
+        """
+        kwargs = {'Prefix': prefix, 'MaxKeys': page_size}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+
+        while 1:
+            try:
+                page = self.s3.list_objects(**kwargs)
+            except Exception as e:
+                handle_exception(e, "Failed to list files.")
+
+            yield page
+
+            if not page.get('IsTruncated'):
+                break
+
+            kwargs['ContinuationToken'] = page['NextContinuationToken']
+
+    def iter_files(self, prefix='', page_size=1000):
+        """
+            Lazily iterates over all files whose name starts with prefix, requesting a page at a time so memory
+            usage doesn't depend on the amount of files.
+
+            Yields {
+                name
+                size
+                last_modified : datetime
+                etag
+            }
+        """
+        for page in self._iter_list_pages(prefix, page_size=page_size):
+            for d in page.get('Contents', ()):
+                yield {
+                    'name': d['Key'],
+                    'size': d['Size'],
+                    'last_modified': d['LastModified'],
+                    'etag': d['ETag']
+                }
+
+    def save_content_addressed(self, content, prefix, extension=''):
+        """
+            Saves content (file like object or bytes) named after its hash, as prefix/<hash><extension>, and
+            returns the name. Content already stored is not uploaded again.
+            The hash is computed with hash_algorithm while the content is spooled, and stored in the file metadata
+            so downloads can be verified.
+        """
+        if isinstance(content, (bytes, bytearray)):
+            content = BytesIO(content)
+        elif hasattr(content, 'seek'):
+            content.seek(0)
+
+        with SpooledTemporaryFile(max_size=self.max_memory_file_size) as spool:
+            reader = HashingReader(content, self.hash_algorithm)
+            shutil.copyfileobj(reader, spool, 64 * 1024)
+            digest = reader.hexdigest()
+
+            name = u"{0}/{1}{2}".format(prefix.rstrip('/'), digest, extension) if prefix else digest + extension
+            if self.exists(name):
+                return name
+
+            spool.seek(0)
+            self.upload_file(name, spool, meta={HASH_META_KEY: u"{0}:{1}".format(self.hash_algorithm, digest)})
+
+        return name
+
     # ---------------------------------------------------------------------------------------------
 
     # Override django's Storage methods so this base implementation can be used.
@@ -382,6 +1501,9 @@ class BaseS3Storage(Storage):
         if name is None:
             raise ValueError("File to save needs a name.")
 
+        if self.background_upload_dir:
+            return self.get_background_uploader().submit(name, content)
+
         self.upload_file(name, content)
 
         return name
@@ -412,9 +1534,18 @@ class BaseS3Storage(Storage):
         """
         Lists the contents of the specified path, returning a 2-tuple of lists;
         the first item being directories, the second item being files.
+        S3 has no folders, they are emulated splitting names by '/'. Use iter_files for big prefixes.
         """
-        # TODO: Implement this with S3 get_objects
-        raise NotImplementedError('subclasses of Storage must provide a listdir() method')
+        prefix = path.rstrip('/') + '/' if path else ''
+        start = len(prefix)
+        dirs = []
+        files = []
+
+        for page in self._iter_list_pages(prefix, delimiter='/'):
+            dirs.extend(d['Prefix'][start:-1] for d in page.get('CommonPrefixes', ()))
+            files.extend(d['Key'][start:] for d in page.get('Contents', ()))
+
+        return dirs, files
 
     def size(self, name):
         s3logger.warn('Storage size method called instead of file.')
@@ -430,7 +1561,8 @@ class BaseS3Storage(Storage):
                 content_type,
                 size,
                 last_modified,
-                meta
+                meta,
+                etag
             }
         """
         return self.head_file(name)
@@ -464,6 +1596,10 @@ class UserPicturesStorage(BaseS3Storage):
 
     max_memory_file_size = 1024 * 1024 * 2  # 2mb
 
+    local_cache = LocalFileCache(S3_CACHE_DIR, S3_CACHE_MAX_SIZE) if S3_CACHE_DIR else None
+    thumbnail_cache_dir = os.path.join(S3_CACHE_DIR, 'thumbnails') if S3_CACHE_DIR else None
+    background_upload_dir = os.path.join(S3_UPLOAD_SPOOL_DIR, 'user_pictures') if S3_UPLOAD_SPOOL_DIR else None
+
 
 # endregion
 # ------------------------------------------------------------------------------
@@ -471,3 +1607,13 @@ class UserPicturesStorage(BaseS3Storage):
 # Instantiate some storages we need
 
 user_picture_storage = UserPicturesStorage()
+
+
+def resume_background_uploads():
+    """
+        Starts the background uploaders of the storages above, resuming the uploads left by dead processes.
+        Called when the web server starts (see clients.app_config), otherwise uploaders start on the first save.
+    """
+    for storage in (user_picture_storage,):
+        if storage.background_upload_dir:
+            storage.get_background_uploader()
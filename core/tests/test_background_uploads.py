@@ -0,0 +1,106 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+from threading import Event
+from django.test import SimpleTestCase
+from core.background_uploads import BackgroundUploader, PENDING, DONE, FAILED
+from core.exceptions import OperationError
+from core.fake_s3 import get_store
+from core.tests.test_storages import FakeStorage
+
+
+class BackgroundUploaderTests(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        self.storage = FakeStorage()
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def wait(self, uploader, name):
+        for _ in range(500):
+            if uploader.status(name) != PENDING:
+                break
+            time.sleep(0.01)
+        return uploader.status(name)
+
+    def test_submit(self):
+        uploader = BackgroundUploader(self.storage, self.path, 1, 10)
+        done = []
+
+        name = uploader.submit('bg/a.txt', b'data', callback=lambda name, error: done.append(error))
+
+        self.assertEqual(name, 'bg/a.txt')
+
+        self.assertEqual(self.wait(uploader, 'bg/a.txt'), DONE)
+        self.assertEqual(self.storage.open('bg/a.txt').read(), b'data')
+        self.assertEqual(done, [None])
+        self.assertEqual(os.listdir(self.path), [])
+        self.assertIsNone(uploader.status('bg/none'))
+
+    def test_queue_full(self):
+        release = Event()
+        put_object = self.storage.s3.put_object
+        self.storage.s3.put_object = lambda **kwargs: release.wait(5) and put_object(**kwargs)
+
+        uploader = BackgroundUploader(self.storage, self.path, 1, 1)
+        uploader.submit('bg/a.txt', b'data')
+
+        with self.assertRaises(OperationError) as ctx:
+            uploader.submit('bg/b.txt', b'data')
+        self.assertEqual(ctx.exception.status_code, 503)
+
+        release.set()
+        self.assertEqual(self.wait(uploader, 'bg/a.txt'), DONE)
+
+    def test_resume(self):
+        # Left by a process with this same pid but another start time, as after a container restart.
+        with open(os.path.join(self.path, 'u1.data'), 'wb') as f:
+            f.write(b'data')
+        with open(os.path.join(self.path, 'u1.{0}-0.run'.format(os.getpid())), 'w') as f:
+            json.dump({'name': 'bg/resumed.txt', 'meta': None}, f)
+
+        class Storage(FakeStorage):
+            background_upload_dir = self.path
+
+        # Not started by creating the storage (any process importing storages), only on startup or first save.
+        storage = Storage()
+        self.assertIsNone(storage._background_uploader)
+        uploader = storage.get_background_uploader()
+
+        self.assertEqual(self.wait(uploader, 'bg/resumed.txt'), DONE)
+        self.assertEqual(self.storage.open('bg/resumed.txt').read(), b'data')
+        self.assertEqual(os.listdir(self.path), [])
+
+    def test_failed(self):
+        def fail(**kwargs):
+            raise OSError("Connection lost")
+
+        self.storage.s3.put_object = fail
+        uploader = BackgroundUploader(self.storage, self.path, 1, 10)
+        errors = []
+
+        uploader.submit('bg/a.txt', b'data', callback=lambda name, error: errors.append(error))
+
+        self.assertEqual(self.wait(uploader, 'bg/a.txt'), FAILED)
+        self.assertEqual(len(errors), 1)
+        self.assertEqual(sorted(f.split('.')[1] for f in os.listdir(self.path)), ['data', 'failed'])
+
+        # Failed uploads are kept for inspection but not resumed.
+        self.assertIsNone(BackgroundUploader(self.storage, self.path, 1, 10).status('bg/a.txt'))
+
+    def test_cleanup(self):
+        uploader = BackgroundUploader(self.storage, self.path, 1, 10)
+
+        for file_name in ('u1.data', 'u1.failed', 'u2.data', 'u3.data', 'u3.1-0.run', 'u4.data', 'u4.failed'):
+            open(os.path.join(self.path, file_name), 'w').close()
+            if not file_name.startswith('u4'):
+                os.utime(os.path.join(self.path, file_name), (0, 0))
+
+        uploader.cleanup()
+
+        # Expired failed uploads and data without record are removed, pending and recent ones are kept.
+        self.assertEqual(sorted(os.listdir(self.path)), ['u3.1-0.run', 'u3.data', 'u4.data', 'u4.failed'])
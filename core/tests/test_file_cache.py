@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from datetime import datetime
+from django.test import SimpleTestCase
+from core.fake_s3 import get_store
+from core.file_cache import LocalFileCache
+from core.tests.test_storages import FakeStorage
+
+
+class LocalFileCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.folder)
+        self.cache = LocalFileCache(self.folder, 1000)
+
+    def put(self, key, data, etag='"1"'):
+        f = self.cache.put('tests', key, BytesIO(data), etag, 'text/plain', len(data), datetime(2020, 1, 1), {'k': key})
+        f.close()
+
+    def data_files(self):
+        return sorted(name for name in os.listdir(self.folder) if name.endswith('.data'))
+
+    def test_get_open(self):
+        self.assertIsNone(self.cache.get('tests', 'a'))
+        self.put('a', b'data')
+
+        entry = self.cache.get('tests', 'a')
+        self.assertEqual((entry['etag'], entry['size'], entry['meta']), ('"1"', 4, {'k': 'a'}))
+        self.assertEqual(entry['last_modified'], datetime(2020, 1, 1))
+
+        with self.cache.open(entry) as f:
+            self.assertEqual(f.read(), b'data')
+
+        # New version replaces the previous data
+        self.put('a', b'new data', '"2"')
+        self.assertEqual(len(self.data_files()), 1)
+        self.assertIsNone(self.cache.open(entry))
+
+        self.cache.delete('tests', 'a')
+        self.assertIsNone(self.cache.get('tests', 'a'))
+        self.assertEqual(self.data_files(), [])
+
+        # Misses are counted by lookups (get and open) only, not by put
+        self.assertEqual(self.cache.stats(), {'hits': 1, 'misses': 3, 'evictions': 0})
+
+    def test_evict(self):
+        self.put('a', b'x' * 400)
+        self.put('b', b'x' * 400)
+
+        # Least recently used first, opening refreshes b
+        os.utime(os.path.join(self.folder, self.cache.get('tests', 'b')['data']), (0, 0))
+        os.utime(os.path.join(self.folder, self.cache.get('tests', 'a')['data']), (1, 1))
+        self.cache.open(self.cache.get('tests', 'b')).close()
+
+        self.put('c', b'x' * 400)
+
+        self.assertEqual([key for key in 'abc' if self.cache.get('tests', key)], ['b', 'c'])
+        self.assertEqual(len(self.data_files()), 2)
+        self.assertEqual(self.cache.stats()['evictions'], 1)
+
+    def test_scan_only_when_needed(self):
+        self.put('a', b'x' * 400)
+
+        scans = []
+        scandir = os.scandir
+        os.scandir = lambda path: scans.append(path) or scandir(path)
+        self.addCleanup(setattr, os, 'scandir', scandir)
+
+        self.put('b', b'x' * 400)
+        self.assertEqual(scans, [])
+
+        self.put('c', b'x' * 400)
+        self.assertEqual(len(scans), 1)
+        self.assertEqual(self.cache._size, 800)
+
+        # Files written by other processes are seen after scan_interval
+        self.cache._last_scan = 0
+        self.put('d', b'')
+        self.assertEqual(len(scans), 2)
+
+
+class DownloadCachedTests(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        self.storage = FakeStorage()
+        self.storage.local_cache = LocalFileCache(folder, 1024 * 1024)
+
+    def test_download_cached(self):
+        requests = []
+        get_object = self.storage.s3.get_object
+        self.storage.s3.get_object = lambda **kwargs: requests.append(kwargs) or get_object(**kwargs)
+
+        self.storage.upload_file('files/a.txt', b'data')
+        self.assertEqual(self.storage.download_file('files/a.txt').read(), b'data')
+
+        # Revalidated with a 304
+        f = self.storage.download_file('files/a.txt')
+        self.assertEqual((f.read(), f.content_type), (b'data', self.storage.head('files/a.txt')['content_type']))
+        self.assertEqual(requests[1], {'Key': 'files/a.txt', 'IfNoneMatch': self.storage.head('files/a.txt')['etag']})
+
+        # Changed files are downloaded again
+        self.storage.upload_file('files/a.txt', b'new data')
+        self.assertEqual(self.storage.download_file('files/a.txt').read(), b'new data')
+
+        self.assertEqual(len(requests), 3)
+        self.assertEqual(self.storage.local_cache.stats(), {'hits': 1, 'misses': 2, 'evictions': 0})
+
+    def test_evicted(self):
+        self.storage.upload_file('files/a.txt', b'data')
+        self.storage.download_file('files/a.txt').close()
+
+        cache = self.storage.local_cache
+        data = cache.get(self.storage.s3_bucket, 'files/a.txt')['data']
+        os.remove(os.path.join(cache.path, data))
+
+        self.assertEqual(self.storage.download_file('files/a.txt').read(), b'data')
+
+        # One miss for each download, the second one found the entry but not its data
+        self.assertEqual(cache.stats(), {'hits': 0, 'misses': 2, 'evictions': 0})
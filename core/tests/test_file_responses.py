@@ -0,0 +1,86 @@
+import os
+from io import BytesIO
+from django.test import SimpleTestCase, RequestFactory
+from core.exceptions import NotFound
+from core.fake_s3 import get_store
+from core.file_responses import storage_file_response, FileChunkIterator
+from core.tests.test_storages import FakeStorage
+
+
+class StorageFileResponseTests(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        self.storage = FakeStorage()
+        self.data = os.urandom(1000)
+        self.storage.upload_file('files/f.bin', self.data)
+        self.factory = RequestFactory()
+
+    def response(self, **headers):
+        return storage_file_response(self.factory.get('/', **headers), self.storage, 'files/f.bin', chunk_size=64)
+
+    def test_full(self):
+        response = self.response()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+        self.assertEqual(response['Content-Length'], '1000')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['ETag'], self.storage.head('files/f.bin')['etag'])
+
+    def test_range(self):
+        response = self.response(HTTP_RANGE='bytes=10-19')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[10:20])
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/1000')
+
+        response = self.response(HTTP_RANGE='bytes=-100')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(b''.join(response.streaming_content), self.data[-100:])
+
+        # Multiple ranges are not forwarded, the whole file is returned.
+        response = self.response(HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), self.data)
+
+    def test_not_modified(self):
+        etag = self.storage.head('files/f.bin')['etag']
+        response = self.response(HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.response(HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+    def test_range_not_satisfiable(self):
+        response = self.response(HTTP_RANGE='bytes=2000-')
+
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */1000')
+
+    def test_attachment(self):
+        response = storage_file_response(self.factory.get('/'), self.storage, 'files/f.bin', u"résumé.bin")
+        self.assertEqual(response['Content-Disposition'], "attachment; filename*=UTF-8''r%C3%A9sum%C3%A9.bin")
+
+    def test_close_on_disconnect(self):
+        opened = []
+        open_stream = self.storage.open_stream
+        self.storage.open_stream = lambda *args: opened.append(open_stream(*args)) or opened[-1]
+
+        response = self.response()
+        next(iter(response.streaming_content))
+        self.assertFalse(opened[0].closed)
+
+        response.close()
+        self.assertTrue(opened[0].closed)
+
+    def test_close_when_exhausted(self):
+        f = BytesIO(self.data)
+        chunks = [bytes(chunk) for chunk in FileChunkIterator(f, 300)]
+
+        self.assertEqual([len(chunk) for chunk in chunks], [300, 300, 300, 100])
+        self.assertEqual(b''.join(chunks), self.data)
+        self.assertTrue(f.closed)
+
+    def test_not_found(self):
+        with self.assertRaises(NotFound):
+            storage_file_response(self.factory.get('/'), self.storage, 'files/none')
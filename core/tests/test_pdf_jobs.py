@@ -0,0 +1,121 @@
+import os
+import shutil
+import tempfile
+from pdfrw import PdfReader
+from django.test import SimpleTestCase
+from core.exceptions import OperationError
+from core.fake_s3 import get_store
+from core.pdf_jobs import PdfJobService, DONE, FAILED
+from core.tests.test_storages import FakeStorage
+from core.tests.test_utils import make_pdf
+
+# Shared with the workers
+FOLDER_STORE = tempfile.mkdtemp()
+
+
+class FolderStorage(FakeStorage):
+    fake_s3 = FOLDER_STORE
+
+
+class PdfJobServiceTests(SimpleTestCase):
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(FOLDER_STORE, ignore_errors=True)
+        super(PdfJobServiceTests, cls).tearDownClass()
+
+    def setUp(self):
+        self.jobs_dir = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(2):
+            fd, path = tempfile.mkstemp(suffix='.pdf')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(make_pdf(3, str(i)))
+            self.paths.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.jobs_dir)
+        for path in self.paths:
+            os.remove(path)
+
+    def test_temporary_file(self):
+        service = PdfJobService(workers=1, jobs_dir=self.jobs_dir)
+        job = service.submit([self.paths[0], (self.paths[1], [2])], outline=[('Last', 3)], info={'Title': 'Jobs'})
+
+        self.assertEqual(job.wait(10), DONE)
+
+        # Polled from another process
+        self.assertEqual(PdfJobService(workers=0, jobs_dir=self.jobs_dir).get(job.id).to_dict(), job.to_dict())
+        self.assertIsNone(service.get('0' * 32))
+        self.assertIsNone(service.get('../' + job.id))
+
+        pdf = PdfReader(job.path)
+        self.assertEqual(len(pdf.pages), 4)
+        self.assertEqual(pdf.Info.Title, '(Jobs)')
+        os.remove(job.path)
+
+    def test_storage(self):
+        get_store(FOLDER_STORE).clear()
+        job = PdfJobService(workers=1, jobs_dir=self.jobs_dir).submit(
+            self.paths, storage=FolderStorage(), name='pdfs/merged.pdf')
+
+        self.assertEqual(job.wait(10), DONE)
+        self.assertIsNone(job.path)
+        data = FolderStorage().download_file('pdfs/merged.pdf', stream=False).read()
+        self.assertEqual(len(PdfReader(fdata=data).pages), 6)
+
+    def test_storage_reused(self):
+        class CountingStorage(FakeStorage):
+            instances = 0
+
+            def __init__(self):
+                CountingStorage.instances += 1
+                super(CountingStorage, self).__init__()
+
+        get_store('memory').clear()
+        service = PdfJobService(workers=0, jobs_dir=self.jobs_dir)
+        storage = CountingStorage()
+
+        for name in ('pdfs/a.pdf', 'pdfs/b.pdf'):
+            self.assertEqual(service.submit(self.paths, storage=storage, name=name).status, DONE)
+
+        # The caller instance and the one kept by the worker for every job
+        self.assertEqual(CountingStorage.instances, 2)
+        self.assertTrue(storage.exists('pdfs/b.pdf'))
+
+    def test_failed(self):
+        service = PdfJobService(workers=0, jobs_dir=self.jobs_dir)
+        job = service.submit([self.paths[0], '/none.pdf'])
+
+        self.assertEqual(job.status, FAILED)
+        self.assertIsNone(job.path)
+        self.assertTrue(job.error)
+        self.assertEqual(service.get(job.id).status, FAILED)
+
+    def test_memory_limit(self):
+        with open(self.paths[0], 'wb') as f:
+            # Bigger than the malloc mmap threshold, so memory freed by previous tests can't be reused.
+            f.write(make_pdf(1, 'x' * 1024 * 1024 * 48))
+
+        job = PdfJobService(workers=1, max_memory=1024 * 1024 * 4, jobs_dir=self.jobs_dir).submit(self.paths)
+        self.assertEqual(job.wait(10), FAILED)
+        self.assertEqual(job.to_dict()['error'], 'MemoryError')
+
+    def test_queue_full(self):
+        service = PdfJobService(workers=1, max_pending=1, jobs_dir=self.jobs_dir)
+        job = service.submit(self.paths)
+
+        with self.assertRaises(OperationError):
+            service.submit(self.paths)
+
+        job.wait(10)
+        os.remove(job.path)
+        self.assertEqual(len(os.listdir(self.jobs_dir)), 1)
+
+    def test_cleanup(self):
+        service = PdfJobService(workers=0, jobs_dir=self.jobs_dir)
+        job = service.submit(self.paths)
+        os.remove(job.path)
+
+        service.record_timeout = -1
+        service.cleanup()
+        self.assertIsNone(service.get(job.id))
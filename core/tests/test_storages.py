@@ -0,0 +1,198 @@
+import os
+from io import BytesIO
+from zipfile import ZipFile
+from django.test import SimpleTestCase
+from core.exceptions import NotFound, OperationError
+from core.fake_s3 import get_store
+from core.storages import BaseS3Storage
+
+
+class FakeStorage(BaseS3Storage):
+    fake_s3 = 'memory'
+    s3_bucket = 'tests'
+
+    # Small sizes so transfers are split without big test files
+    multipart_threshold = 1024 * 1024 * 6
+    multipart_chunk_size = 1024 * 1024 * 5
+    multipart_retry_delay = 0
+    download_threshold = 1024 * 64
+    download_chunk_size = 1024 * 64
+    range_block_size = 1024
+    max_memory_file_size = 1024 * 128
+    delete_batch_size = 3
+
+
+class StorageTestCase(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        self.storage = FakeStorage()
+
+
+# Uploads
+class UploadTests(StorageTestCase):
+    def test_upload_small(self):
+        self.storage.save('files/a.txt', BytesIO(b'data'))
+        self.assertEqual(self.storage.open('files/a.txt').read(), b'data')
+        self.assertEqual(self.storage.head('files/a.txt')['content_type'], 'text/plain')
+
+    def test_upload_multipart(self):
+        data = os.urandom(1024 * 1024 * 12)
+        progress = []
+
+        self.storage.upload_file('files/big.bin', BytesIO(data), meta={'k': 'v'},
+                                 progress=lambda uploaded, total: progress.append(uploaded))
+
+        self.assertEqual(progress, [1024 * 1024 * 5, 1024 * 1024 * 10, len(data)])
+        self.assertEqual(self.storage.download_file('files/big.bin', stream=False).read(), data)
+        self.assertTrue(self.storage.head('files/big.bin')['etag'].endswith('-3"'))
+        self.assertEqual(self.storage.head('files/big.bin')['meta'], {'k': 'v'})
+
+    def test_upload_multipart_failure_aborts(self):
+        def fail(**kwargs):
+            raise OSError("Connection lost")
+
+        self.storage.s3.upload_part = fail
+
+        with self.assertRaises(OperationError):
+            self.storage.upload_file('files/big.bin', os.urandom(1024 * 1024 * 7))
+
+        self.assertEqual(self.storage.s3.pending_uploads(), 0)
+        self.assertFalse(self.storage.exists('files/big.bin'))
+
+    def test_upload_etag_mismatch(self):
+        put_object = self.storage.s3.put_object
+        self.storage.s3.put_object = lambda **kwargs: dict(put_object(**kwargs), ETag='"bad"')
+
+        with self.assertRaises(OperationError):
+            self.storage.upload_file('files/a.txt', b'data')
+
+        self.assertFalse(self.storage.exists('files/a.txt'))
+
+    def test_upload_encrypted(self):
+        # KMS and customer key ETags are not MD5s, encrypted files are stored and served without checking them.
+        put_object = self.storage.s3.put_object
+        get_object = self.storage.s3.get_object
+        self.storage.s3.put_object = lambda **kwargs: dict(put_object(**kwargs), ETag='"' + 'a' * 32 + '"',
+                                                           ServerSideEncryption='aws:kms')
+        self.storage.s3.get_object = lambda **kwargs: dict(get_object(**kwargs), ETag='"' + 'a' * 32 + '"',
+                                                           SSECustomerAlgorithm='AES256')
+
+        self.storage.upload_file('files/a.txt', b'data')
+        self.assertEqual(self.storage.download_file('files/a.txt', stream=False).read(), b'data')
+
+    def test_upload_multipart_etag_mismatch(self):
+        complete = self.storage.s3.complete_multipart_upload
+        self.storage.s3.complete_multipart_upload = lambda **kwargs: dict(complete(**kwargs), ETag='"bad-2"')
+
+        with self.assertRaises(OperationError):
+            self.storage.upload_file('files/big.bin', os.urandom(1024 * 1024 * 7))
+
+        self.assertFalse(self.storage.exists('files/big.bin'))
+
+    def test_upload_forgets_head(self):
+        put_object = self.storage.s3.put_object
+
+        def put_checking(**kwargs):
+            # HEAD from another request while uploading
+            self.assertFalse(self.storage.exists('files/a.txt'))
+            return put_object(**kwargs)
+
+        self.storage.s3.put_object = put_checking
+        self.storage.upload_file('files/a.txt', b'data')
+
+        self.assertTrue(self.storage.exists('files/a.txt'))
+
+    def test_head_cache(self):
+        self.assertFalse(self.storage.exists('files/a.txt'))
+
+        # Uploaded by another process, not found results aren't cached
+        FakeStorage().upload_file('files/a.txt', b'data')
+        self.assertTrue(self.storage.exists('files/a.txt'))
+
+        self.storage.s3.head_object = None  # Found results are
+        self.assertEqual(self.storage.head('files/a.txt')['size'], 4)
+
+    def test_save_content_addressed(self):
+        name = self.storage.save_content_addressed(b'data', 'hashed', '.txt')
+
+        self.assertEqual(name, 'hashed/8d777f385d3dfec8815d20f7496026dc.txt')
+        self.assertEqual(self.storage.head(name)['meta'], {'content-hash': 'md5:8d777f385d3dfec8815d20f7496026dc'})
+
+        self.storage.s3.put_object = None  # Not uploaded again
+        self.assertEqual(self.storage.save_content_addressed(BytesIO(b'data'), 'hashed', '.txt'), name)
+
+
+# Downloads
+class DownloadTests(StorageTestCase):
+    def test_download_not_found(self):
+        with self.assertRaises(NotFound):
+            self.storage.download_file('files/none', stream=False)
+
+    def test_download_ranges(self):
+        for size in (0, 10, 1024 * 64, 1024 * 64 + 1, 1024 * 300 + 7):
+            data = os.urandom(size)
+            self.storage.upload_file('files/f', data)
+            f = self.storage.download_file('files/f', stream=False)
+            self.assertEqual(f.size, size)
+            self.assertEqual(f.read(), data)
+
+    def test_download_corrupted(self):
+        self.storage.upload_file('files/f', b'data')
+        store = get_store('memory')
+        store.put('tests', 'files/f', b'dat4', store.get('tests', 'files/f')[1])
+
+        with self.assertRaises(OperationError):
+            self.storage.download_file('files/f', stream=False)
+
+    def test_getbuffer(self):
+        for size in (0, 1000, 1024 * 200):
+            data = os.urandom(size)
+            self.storage.upload_file('files/f', data)
+            f = self.storage.download_file('files/f', stream=False)
+            view = f.getbuffer()
+            self.assertEqual(view[:], data)
+            view.release()
+            f.close()
+
+    def test_seekable_file(self):
+        buf = BytesIO()
+        with ZipFile(buf, 'w') as z:
+            for i in range(20):
+                z.writestr('f{0}'.format(i), os.urandom(1000))
+
+        self.storage.upload_file('files/f.zip', buf.getvalue())
+        z = ZipFile(self.storage.download_file_seekable('files/f.zip'))
+
+        self.assertEqual(len(z.namelist()), 20)
+        self.assertEqual(z.read('f3'), ZipFile(buf).read('f3'))
+
+
+# Listing and deleting
+class ListDeleteTests(StorageTestCase):
+    def setUp(self):
+        super(ListDeleteTests, self).setUp()
+        for name in ('l/a/1', 'l/a/2', 'l/b/3', 'l/f1', 'l/f2', 'other'):
+            self.storage.upload_file(name, b'x')
+
+    def test_listdir(self):
+        self.assertEqual(self.storage.listdir('l'), (['a', 'b'], ['f1', 'f2']))
+        self.assertEqual(self.storage.listdir('l/a/'), ([], ['1', '2']))
+
+    def test_iter_files_pages(self):
+        names = [f['name'] for f in self.storage.iter_files('l/', page_size=2)]
+        self.assertEqual(names, ['l/a/1', 'l/a/2', 'l/b/3', 'l/f1', 'l/f2'])
+
+    def test_delete_many(self):
+        self.assertEqual(self.storage.delete_many(['l/f1', 'l/f2', 'none']), {'l/f1': None, 'l/f2': None, 'none': None})
+        self.assertEqual(self.storage.exists_many(['l/f1', 'l/a/1']), {'l/f1': False, 'l/a/1': True})
+
+    def test_delete_prefix(self):
+        self.assertEqual(self.storage.delete_prefix('l/'), {})
+        self.assertEqual([f['name'] for f in self.storage.iter_files()], ['other'])
+
+
+# Urls
+class UrlTests(StorageTestCase):
+    def test_url_cached(self):
+        self.assertEqual(self.storage.url('files/a.txt'), self.storage.url('files/a.txt'))
+        self.assertNotEqual(self.storage.url('files/a.txt'), self.storage.url('files/b.txt'))
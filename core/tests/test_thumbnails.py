@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO
+from concurrent.futures import Future
+from PIL import Image
+from django.test import SimpleTestCase
+from core.fake_s3 import get_store
+from core.file_cache import LocalFileCache
+from core.tests.test_storages import FakeStorage
+from core.tests.test_utils import make_image
+from core.utils import ImageThumbnail
+from core.thumbnails import ThumbnailService
+
+
+# Process pool thumbnails
+class ThumbnailServiceTests(SimpleTestCase):
+    def test_submit(self):
+        for workers in (0, 1):
+            service = ThumbnailService(workers=workers)
+            renditions, img_format = service.submit(make_image((800, 400)), [(128, 128), (256, 256)]).result(30)
+
+            self.assertEqual(img_format, 'PNG')
+            self.assertEqual([Image.open(f).size for _, f in renditions], [(256, 128), (128, 64)])
+            self.assertEqual(service.pool.pending(), 0)
+
+    def test_saturated(self):
+        service = ThumbnailService(workers=1, max_pending=0)
+        future = service.submit(make_image((800, 400)))
+
+        # Ran on this thread
+        self.assertTrue(future.done())
+        self.assertEqual(len(future.result()[0]), 3)
+
+    def test_invalid_image(self):
+        with self.assertRaises(ValueError):
+            ThumbnailService(workers=1).create_many(BytesIO(b'not an image'), timeout=30)
+
+    def test_job_done_failure(self):
+        paths = []
+        for _ in range(3):
+            fd, path = tempfile.mkstemp()
+            os.close(fd)
+            paths.append(path)
+            self.addCleanup(lambda path: os.path.exists(path) and os.remove(path), path)
+
+        os.remove(paths[1])  # Fails to open the second rendition
+
+        job = Future()
+        job.set_result(([((256, 256), paths[0]), ((128, 128), paths[1]), ((64, 64), paths[2])], 'PNG'))
+        res = Future()
+        ThumbnailService._job_done(job, res, None)
+
+        # Failed instead of never done, without leaving files behind
+        with self.assertRaises(IOError):
+            res.result(0)
+        self.assertEqual([path for path in paths if os.path.exists(path)], [])
+
+
+# Thumbnails cache
+class FailingThumbnail(ImageThumbnail):
+    @classmethod
+    def create_many(cls, data, sizes=None):
+        raise AssertionError("Thumbnails created again.")
+
+
+class ThumbnailsStorage(FakeStorage):
+    thumbnail_workers = 0
+
+
+class ThumbnailCacheTests(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        self.storage = ThumbnailsStorage()
+
+    def test_thumbnail_url(self):
+        self.storage.upload_file('images/a.jpg', make_image((800, 400)))
+
+        self.assertIsNone(self.storage.thumbnail_url('images/a.jpg', (128, 128)))
+        url = self.storage.thumbnail_url('images/a.jpg', (128, 128), create=True)
+        self.assertIsNotNone(url)
+
+        # Same content on other name shares the thumbnail
+        self.storage.upload_file('images/b.jpg', make_image((800, 400)))
+        self.assertEqual(self.storage.thumbnail_url('images/b.jpg', (128, 128)), url)
+
+    def test_create_once(self):
+        cache = self.storage.get_thumbnail_cache()
+        names = cache.create(make_image((800, 400)), [(256, 256), (128, 128)])
+
+        cache.service = None
+        cache.thumbnail_class = FailingThumbnail
+        self.assertEqual(cache.create(make_image((800, 400)), [(256, 256), (128, 128)]), names)
+
+    def test_local_cache(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        cache = self.storage.get_thumbnail_cache()
+        cache.local_cache = LocalFileCache(folder, 1024 * 1024)
+        source_hash = list(cache.create(make_image((800, 400)), [(128, 128)]).values())[0].split('/')[-2]
+
+        get_store('memory').clear()  # Only on the local cache now
+        self.assertEqual(Image.open(cache.open(source_hash, (128, 128))).size, (128, 64))
+        self.assertIsNone(cache.open(source_hash, (64, 64)))
+
+    def test_local_cache_recreated(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+
+        cache = self.storage.get_thumbnail_cache()
+        cache.local_cache = LocalFileCache(folder, 1024 * 1024)
+        name = cache.create(make_image((800, 400)), [(128, 128)])[(128, 128)]
+
+        # Created again once purged from S3, replacing the local entry
+        self.storage.delete_prefix(cache.prefix + '/')
+        self.assertEqual(cache.create(make_image((800, 400)), [(128, 128)]), {(128, 128): name})
+
+        entry = cache.local_cache.get(self.storage.s3_bucket, name)
+        self.assertEqual(entry['size'], self.storage.head(name)['size'])
+        self.assertEqual(entry['content_type'], 'image/png')
+
+        cache.local_cache.delete(self.storage.s3_bucket, name)
+        self.assertEqual(os.listdir(folder), [])
@@ -0,0 +1,241 @@
+import os
+from io import BytesIO
+from zipfile import ZipFile, ZIP_DEFLATED
+from PIL import Image
+from PIL.GifImagePlugin import GifImageFile
+from django.test import SimpleTestCase
+from core.fake_s3 import get_store
+from core.tests.test_storages import FakeStorage
+from pdfrw import PdfReader, PdfWriter, PdfDict, PdfName, PdfArray, IndirectPdfDict
+from pdfrw.errors import PdfOutputError
+from core.utils import ImageThumbnail, ZipFile2, ZipStream, NewPdfWriter, StreamingPdfWriter
+
+
+def make_image(size, format='JPEG'):
+    data = BytesIO()
+    Image.new('RGB', size, (200, 10, 10)).save(data, format=format)
+    data.seek(0)
+    return data
+
+
+def make_pdf(pages, tag):
+    writer = PdfWriter()
+    for i in range(pages):
+        contents = IndirectPdfDict()
+        contents.stream = u"BT /F1 12 Tf 20 100 Td ({0} {1}) Tj ET".format(tag, i)
+        writer.addpage(PdfDict(Type=PdfName.Page, MediaBox=PdfArray([0, 0, 300, 200]), Contents=contents))
+
+    data = BytesIO()
+    writer.write(data)
+    return data.getvalue()
+
+
+# Images
+class ImageThumbnailTests(SimpleTestCase):
+    def test_create(self):
+        res, img_format = ImageThumbnail.create(make_image((400, 200)))
+
+        self.assertEqual(img_format, 'PNG')
+        self.assertEqual(Image.open(res).size, (128, 64))
+
+    def test_create_many(self):
+        sizes = [(64, 64), (1024, 1024), (256, 256)]
+        renditions, img_format = ImageThumbnail.create_many(make_image((2000, 1000)), sizes)
+
+        self.assertEqual([size for size, _ in renditions], [(1024, 1024), (256, 256), (64, 64)])
+        self.assertEqual([Image.open(res).size for _, res in renditions], [(1024, 512), (256, 128), (64, 32)])
+
+    def test_create_many_not_nested(self):
+        renditions, _ = ImageThumbnail.create_many(make_image((2000, 1000)), [(1000, 100), (300, 300), (150, 20)])
+
+        self.assertEqual([size for size, _ in renditions], [(1000, 100), (300, 300), (150, 20)])
+        self.assertEqual([Image.open(res).size for _, res in renditions], [(200, 100), (300, 150), (40, 20)])
+
+    def test_invalid_image(self):
+        with self.assertRaises(ValueError):
+            ImageThumbnail.create_many(BytesIO(b'not an image'))
+
+    def test_read_header(self):
+        frames = [Image.new('P', (30, 20), i) for i in range(3)]
+        data = BytesIO()
+        frames[0].save(data, format='GIF', save_all=True, append_images=frames[1:])
+        data.seek(0)
+
+        self.assertEqual(ImageThumbnail.read_header(data), {'format': 'GIF', 'width': 30, 'height': 20, 'frames': 3})
+
+    def test_big_gif(self):
+        class Thumbnail(ImageThumbnail):
+            max_pixels = 100 * 100
+
+        frames = [Image.new('P', (200, 200), i) for i in range(3)]
+        data = BytesIO()
+        frames[0].save(data, format='GIF', save_all=True, append_images=frames[1:])
+        data.seek(0)
+
+        # Frames aren't counted (which decodes them) for images over max_pixels
+        self.assertEqual(Thumbnail.read_header(data)['frames'], None)
+        with self.assertRaises(ValueError):
+            Thumbnail.create(data)
+
+    def test_truncated_gif(self):
+        frames = [Image.new('P', (100, 100), i) for i in range(3)]
+        data = BytesIO()
+        frames[0].save(data, format='GIF', save_all=True, append_images=frames[1:])
+
+        # As Pillow 4.1 counting the frames of a truncated file
+        def truncated(img):
+            raise IOError("image file is truncated")
+
+        n_frames = GifImageFile.n_frames
+        GifImageFile.n_frames = property(truncated)
+        self.addCleanup(setattr, GifImageFile, 'n_frames', n_frames)
+
+        with self.assertRaises(ValueError):
+            ImageThumbnail.read_header(BytesIO(data.getvalue()))
+
+        # Stored images are checked from the file start only, without counting frames
+        get_store('memory').clear()
+        storage = FakeStorage()
+        storage.upload_file('images/a.gif', data.getvalue())
+
+        class Thumbnail(ImageThumbnail):
+            header_size = 1024
+
+        self.assertEqual(Thumbnail.check_stored(storage, 'images/a.gif'),
+                         {'format': 'GIF', 'width': 100, 'height': 100, 'frames': None})
+
+    def test_too_many_pixels(self):
+        class Thumbnail(ImageThumbnail):
+            max_pixels = 1000 * 1000
+
+        with self.assertRaises(ValueError):
+            Thumbnail.create(make_image((1001, 1000)))
+
+    def test_check_stored(self):
+        get_store('memory').clear()
+        storage = FakeStorage()
+
+        # Noise so the file is bigger than the header size
+        data = BytesIO()
+        Image.frombytes('RGB', (300, 300), os.urandom(300 * 300 * 3)).save(data, format='JPEG')
+        storage.upload_file('images/a.jpg', data.getvalue())
+        storage.upload_file('images/b.jpg', b'x' * 1024 * 20)
+
+        self.assertEqual(ImageThumbnail.check_stored(storage, 'images/a.jpg'),
+                         {'format': 'JPEG', 'width': 300, 'height': 300, 'frames': 1})
+        with self.assertRaises(ValueError):
+            ImageThumbnail.check_stored(storage, 'images/b.jpg')
+
+
+# Zip files
+class ZipFile2Tests(SimpleTestCase):
+    def test_write_stream_and_many(self):
+        entries = [(u"f{0}".format(i), os.urandom(i * 1000) + b'a' * 5000) for i in range(10)]
+        buf = BytesIO()
+
+        with ZipFile2(buf, 'w', ZIP_DEFLATED) as z:
+            z.write_stream('first', BytesIO(b'first'))
+            z.write_many([(name, BytesIO(data)) for name, data in entries], max_pending=3)
+            z.write_stream('last', BytesIO(b'last'))
+
+        z = ZipFile(buf)
+        self.assertIsNone(z.testzip())
+        self.assertEqual(z.namelist(), ['first'] + [name for name, _ in entries] + ['last'])
+        self.assertEqual([z.read(name) for name, _ in entries], [data for _, data in entries])
+
+    def test_zip_stream(self):
+        entries = [('bytes', b'a' * 1000), ('file', BytesIO(os.urandom(1024 * 200))), ('iter', iter([b'b', b'c']))]
+        chunks = list(ZipStream().stream(entries))
+
+        z = ZipFile(BytesIO(b''.join(chunks)))
+        self.assertGreater(len(chunks), 3)
+        self.assertIsNone(z.testzip())
+        self.assertEqual(z.read('file'), entries[1][1].getvalue())
+        self.assertEqual(z.read('iter'), b'bc')
+
+
+# PDFs
+class NewPdfWriterTests(SimpleTestCase):
+    def setUp(self):
+        self.writer = NewPdfWriter()
+        self.writer.addpages(PdfReader(fdata=make_pdf(4, 'A')).pages)
+
+    def test_add_bookmark(self):
+        chapter = self.writer.add_bookmark('Chapter', 0)
+        section = self.writer.add_bookmark('Section', 1, chapter)
+        self.writer.add_bookmark('Subsection', 2, section)
+        self.writer.add_bookmark('Section 2', 3, chapter)
+
+        self.assertEqual((self.writer._outline.Count, chapter.Count, section.Count), (4, 3, 1))
+        self.assertEqual(section.Next.Title, '(Section 2)')
+
+        with self.assertRaises(PdfOutputError):
+            self.writer.add_bookmark('Missing', 4)
+
+    def test_set_outline(self):
+        outline = self.writer.set_outline([
+            ('Chapter', 0, [('Section', 1, [('Subsection', 2)]), ('Section 2', 3)]),
+            ('Appendix', 3, [])
+        ])
+
+        chapter = outline.First
+        self.assertEqual((outline.Count, chapter.Count, chapter.First.Count), (5, 3, 1))
+        self.assertEqual(chapter.Last.Prev, chapter.First)
+        self.assertEqual(outline.Last.Title, '(Appendix)')
+        self.assertIsNone(outline.Last.Count)
+
+        out = BytesIO()
+        self.writer.write(out)
+        self.assertEqual(PdfReader(fdata=out.getvalue()).Root.Outlines.First.First.First.Title, '(Subsection)')
+
+        self.assertIsNone(self.writer.set_outline([]))
+
+
+class StreamingPdfWriterTests(SimpleTestCase):
+    def test_merge(self):
+        out = BytesIO()
+        writer = StreamingPdfWriter(out)
+        writer.add_document(make_pdf(3, 'A'))
+        writer.add_document(BytesIO(make_pdf(3, 'B')), pages=[2, 0])
+        parent = writer.add_bookmark('B', 3)
+        writer.add_bookmark('B 0', 4, parent)
+        writer.set_info({'Title': 'Merged'})
+        writer.close()
+
+        pdf = PdfReader(fdata=out.getvalue())
+        self.assertEqual([page.Contents.stream.split('(')[1].split(')')[0] for page in pdf.pages],
+                         ['A 0', 'A 1', 'A 2', 'B 2', 'B 0'])
+        self.assertEqual(pdf.Info.Title, '(Merged)')
+        self.assertEqual(pdf.Root.Outlines.First.First.Title, '(B 0)')
+
+    def test_repeated_pages(self):
+        out = BytesIO()
+        writer = StreamingPdfWriter(out)
+        writer.add_document(make_pdf(2, 'A'), pages=[0, 1, 0])
+        writer.close()
+
+        pdf = PdfReader(fdata=out.getvalue())
+        self.assertEqual([page.Contents.stream.split('(')[1].split(')')[0] for page in pdf.pages],
+                         ['A 0', 'A 1', 'A 0'])
+        self.assertIsNot(pdf.pages[0], pdf.pages[2])
+
+    def test_failed_document(self):
+        out = BytesIO()
+        writer = StreamingPdfWriter(out)
+        writer.add_document(make_pdf(1, 'A'))
+
+        # Fails after writing the first page, with the second one reserved.
+        addpage = writer.addpage
+        writer.addpage = lambda page: addpage(page) if len(writer.pagearray) < 2 else 1 / 0
+
+        with self.assertRaises(ZeroDivisionError):
+            writer.add_document(make_pdf(2, 'B'))
+        with self.assertRaises(Exception):
+            writer.add_document(b'not a pdf')
+
+        del writer.addpage
+        writer.add_document(make_pdf(1, 'C'))
+        writer.close()
+
+        pdf = PdfReader(fdata=out.getvalue())
+        self.assertEqual([page.Contents.stream.split('(')[1].split(')')[0] for page in pdf.pages], ['A 0', 'C 0'])
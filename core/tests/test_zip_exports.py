@@ -0,0 +1,55 @@
+import os
+from io import BytesIO
+from zipfile import ZipFile
+from django.test import SimpleTestCase
+from core.exceptions import NotFound
+from core.fake_s3 import get_store
+from core.tests.test_storages import FakeStorage
+from core.utils import ZipFile2
+from core.zip_exports import ZipExport
+
+
+# Zip exports
+class ZipExportTests(SimpleTestCase):
+    def setUp(self):
+        get_store('memory').clear()
+        self.storage = FakeStorage()
+        self.files = {u"export/f{0}".format(i): os.urandom(i * 1000) for i in range(10)}
+
+        for name, data in self.files.items():
+            self.storage.upload_file(name, data)
+
+    def check_zip(self, data, names):
+        z = ZipFile(BytesIO(data))
+        self.assertIsNone(z.testzip())
+        self.assertEqual(z.namelist(), [os.path.basename(name) for name in names])
+        self.assertEqual([z.read(os.path.basename(name)) for name in names], [self.files[name] for name in names])
+
+    def test_write(self):
+        names = sorted(self.files)
+        export = ZipExport(self.storage, names, prefetch=3, arcname=os.path.basename)
+        buf = BytesIO()
+        export.write(buf)
+
+        self.check_zip(buf.getvalue(), names)
+        stats = export.get_stats()
+        self.assertEqual((stats['files'], stats['bytes']), (10, sum(len(d) for d in self.files.values())))
+        self.assertIn(stats['bound'], ('network', 'cpu'))
+
+    def test_stream(self):
+        names = sorted(self.files, reverse=True)
+        export = ZipExport(self.storage, names, arcname=os.path.basename)
+
+        self.check_zip(b''.join(export.stream()), names)
+
+    def test_write_many(self):
+        names = sorted(self.files)
+        buf = BytesIO()
+        with ZipFile2(buf, 'w') as z:
+            z.write_many(ZipExport(self.storage, names, arcname=os.path.basename).entries(), max_pending=4)
+
+        self.check_zip(buf.getvalue(), names)
+
+    def test_missing_file(self):
+        with self.assertRaises(NotFound):
+            ZipExport(self.storage, ['export/f1', 'export/none']).write(BytesIO())
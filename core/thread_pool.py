@@ -1,4 +1,7 @@
+import os
+
 from builtins import object
+from threading import Lock
 from multiprocessing.pool import ThreadPool as TP
 from django.db import connection
 from django.conf import settings
@@ -40,3 +43,27 @@ class ThreadPool(object):
         '''
 
         return self.pool.apply_async(_apply_wrapper, (fun, args))
+
+
+_shared_pools = {}
+_shared_pools_pid = None
+_shared_pools_lock = Lock()
+
+
+def get_shared_pool(name, workers):
+    """
+        Returns the process wide pool called name with the given workers, created on first use and again on
+        each forked process. Pools are kept per amount of workers, so callers asking for a different size
+        get their own pool instead of silently sharing the first one created.
+    """
+    global _shared_pools_pid
+
+    with _shared_pools_lock:
+        if _shared_pools_pid != os.getpid():
+            _shared_pools.clear()
+            _shared_pools_pid = os.getpid()
+
+        pool = _shared_pools.get((name, workers))
+        if pool is None:
+            pool = _shared_pools[(name, workers)] = ThreadPool(workers)
+        return pool
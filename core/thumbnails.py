@@ -0,0 +1,266 @@
+import os
+import shutil
+import hashlib
+import mimetypes
+import tempfile
+
+from builtins import object
+from datetime import datetime
+from dateutil import tz
+from concurrent.futures import Future
+from core.process_pool import ProcessPool
+from core.storages import get_expected_hash, get_data_size
+from core.utils import ImageThumbnail
+
+'''
+    Thumbnails created on a process pool, so resizing and encoding don't hold the GIL of the web server threads.
+    Images and thumbnails are passed to and from the workers as temporary file paths instead of pickled buffers.
+
+    Created thumbnails can be cached by source content hash, size, format and quality: on S3 next to the source
+    files (under the storage thumbnail_prefix) and optionally on a local disk cache in front of it.
+'''
+
+
+def _create_thumbnails(thumbnail_class, path, sizes, spool_dir):
+    # Runs on the worker, returns the thumbnails as temporary file paths.
+    with open(path, 'rb') as f:
+        renditions, img_format = thumbnail_class.create_many(f, sizes)
+
+    res = []
+
+    try:
+        for size, data in renditions:
+            fd, out_path = tempfile.mkstemp(dir=spool_dir, prefix='thmbtemp')
+            res.append((size, out_path))
+
+            with os.fdopen(fd, 'wb') as f:
+                shutil.copyfileobj(data, f, 64 * 1024)
+
+    except Exception:
+        for _, out_path in res:
+            os.remove(out_path)
+        raise
+
+    finally:
+        for _, data in renditions:
+            data.close()
+
+    return res, img_format
+
+
+class ThumbnailService(object):
+    """
+        Creates thumbnails with thumbnail_class.create_many on a process pool.
+        thumbnail_class must be importable by the workers (defined at module level).
+    """
+
+    def __init__(self, thumbnail_class=ImageThumbnail, workers=None, max_pending=None, timeout=30, spool_dir=None):
+        """
+            workers, max_pending and timeout are the ProcessPool ones, jobs run on the calling thread once
+                max_pending jobs are queued or running.
+            spool_dir: folder for the temporary files, defaults to the system one.
+        """
+        self.thumbnail_class = thumbnail_class
+        self.spool_dir = spool_dir
+        self.pool = ProcessPool(workers, max_pending, timeout)
+
+    def submit(self, data, sizes=None):
+        """
+            Queues the creation of thumbnails of data (file-like object or django uploaded file) and returns a
+            Future with the same result as create_many: a list of (size, file) and the thumbnails extension.
+            The caller is responsable of closing the files.
+
+            File constraints and image header are checked before queuing, raising ValueError.
+        """
+        self.thumbnail_class.check_file(data)
+
+        # Reject invalid or too big images before queuing them.
+        self.thumbnail_class.check_header(self.thumbnail_class.read_header(data))
+
+        # Files uploaded to disk by django can be read by the workers directly.
+        if hasattr(data, 'temporary_file_path'):
+            path = data.temporary_file_path()
+            owned = False
+        else:
+            fd, path = tempfile.mkstemp(dir=self.spool_dir, prefix='thmbsrc')
+            owned = True
+
+            if hasattr(data, 'seek'):
+                data.seek(0)
+
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    shutil.copyfileobj(data, f, 64 * 1024)
+            except Exception:
+                os.remove(path)
+                raise
+
+        res = Future()
+        job = self.pool.submit(_create_thumbnails, self.thumbnail_class, path, sizes, self.spool_dir)
+        job.add_done_callback(lambda job: self._job_done(job, res, path if owned else None))
+
+        return res
+
+    def create_many(self, data, sizes=None, timeout=None):
+        """
+            Same as ImageThumbnail.create_many but running on the pool, waiting up to timeout seconds.
+        """
+        return self.submit(data, sizes).result(timeout)
+
+    @staticmethod
+    def _job_done(job, res, path):
+        # Exceptions raised by done callbacks are discarded, so any failure must be set on res or it never ends.
+        files = []
+        renditions = []
+
+        try:
+            if path:
+                os.remove(path)
+
+            renditions, img_format = job.result()
+
+            # Removed once opened so nothing is left behind when closed.
+            for size, out_path in renditions:
+                files.append((size, open(out_path, 'rb')))
+                os.remove(out_path)
+
+        except Exception as e:
+            for _, f in files:
+                f.close()
+
+            for _, out_path in renditions[len(files):]:
+                try:
+                    os.remove(out_path)
+                except OSError:
+                    pass
+
+            res.set_exception(e)
+            return
+
+        res.set_result((files, img_format))
+
+
+class ThumbnailCache(object):
+    """
+        Content addressed thumbnails of a storage, named <prefix>/<source hash>/<width>x<height>-<quality>.<ext>,
+        so renditions are shared by identical sources and never need to be invalidated.
+    """
+
+    def __init__(self, storage, prefix, thumbnail_class=ImageThumbnail, local_cache=None, service=None):
+        """
+            storage: BaseS3Storage where renditions are stored.
+            prefix: S3 prefix for the renditions.
+            local_cache: optional LocalFileCache checked before S3.
+            service: optional ThumbnailService to create the renditions, otherwise created on the calling thread.
+        """
+        self.storage = storage
+        self.prefix = prefix.rstrip('/')
+        self.thumbnail_class = thumbnail_class
+        self.local_cache = local_cache
+        self.service = service
+
+    def rendition_name(self, source_hash, size):
+        img_format = self.thumbnail_class.format
+        quality = self.thumbnail_class.quality
+        extension = img_format.lower() if img_format else 'img'
+
+        return u"{0}/{1}/{2}x{3}-{4}.{5}".format(self.prefix, source_hash, size[0], size[1], quality, extension)
+
+    def source_hash(self, name):
+        """
+            Returns the content hash of a stored file, from its metadata if saved content addressed or its ETag.
+            Raises NotFound if file not found.
+        """
+        head = self.storage.head_file(name)
+        expected = get_expected_hash(head['etag'], head['meta'])
+
+        # Multipart uploads ETags are not a hash of the content but are still unique for it.
+        return u"{0}-{1}".format(*expected) if expected else u"etag-" + head['etag'].strip('"')
+
+    def url(self, source_hash, size):
+        """
+            Returns the url of a rendition or None if it was not created yet.
+        """
+        name = self.rendition_name(source_hash, size)
+        return self.storage.url(name) if self.storage.exists(name) else None
+
+    def open(self, source_hash, size):
+        """
+            Returns a rendition opened for reading, from the local cache if possible, or None if it was not
+            created yet. The caller is responsable of closing it.
+        """
+        name = self.rendition_name(source_hash, size)
+        bucket = self.storage.s3_bucket
+
+        if self.local_cache is not None:
+            entry = self.local_cache.get(bucket, name)
+            data = self.local_cache.open(entry) if entry else None
+            if data is not None:
+                return data
+
+        if not self.storage.exists(name):
+            return None
+
+        data = self.storage.download_file(name, stream=False)
+        if self.local_cache is None:
+            return data
+
+        with data:
+            return self._cache_local(name, data)
+
+    def _cache_local(self, name, data):
+        # Renditions never change so their name is used as ETag. Content type is guessed as uploads do.
+        content_type = mimetypes.guess_type(name, strict=False)[0] or self.storage.default_content_type
+
+        return self.local_cache.put(self.storage.s3_bucket, name, data, name, content_type, get_data_size(data),
+                                    datetime.now(tz.tzutc()), {})
+
+    def create(self, data, sizes=None, source_hash=None):
+        """
+            Creates and stores the renditions of data (seekable file like object) not created yet.
+            sizes defaults to the thumbnail_class sizes, source_hash is computed from data if not given.
+            Returns a dict with each size rendition name.
+        """
+        sizes = list(sizes or self.thumbnail_class.sizes)
+
+        if source_hash is None:
+            source_hash = self._hash(data)
+
+        names = {size: self.rendition_name(source_hash, size) for size in sizes}
+        exists = self.storage.exists_many(list(names.values()))
+        missing = [size for size in sizes if not exists[names[size]]]
+
+        if not missing:
+            return names
+
+        data.seek(0)
+        if self.service is not None:
+            renditions, _ = self.service.create_many(data, missing)
+        else:
+            renditions, _ = self.thumbnail_class.create_many(data, missing)
+
+        try:
+            for size, f in renditions:
+                self.storage.upload_file(names[size], f)
+
+                if self.local_cache is not None:
+                    f.seek(0)
+                    self._cache_local(names[size], f).close()
+        finally:
+            for _, f in renditions:
+                f.close()
+
+        return names
+
+    def _hash(self, data):
+        h = hashlib.new(self.storage.hash_algorithm)
+        data.seek(0)
+
+        while 1:
+            buf = data.read(64 * 1024)
+            if not buf:
+                break
+            h.update(buf)
+
+        # Same form as content addressed files hashes, so both match.
+        return u"{0}-{1}".format(self.storage.hash_algorithm, h.hexdigest())
@@ -5,20 +5,36 @@ import time
 import sys
 import shutil
 from PIL import Image
+from io import BytesIO
+from collections import deque
+from functools import partial
 from tempfile import SpooledTemporaryFile
+from core.thread_pool import get_shared_pool
 from zipfile import BadZipfile, ZipInfo, ZipFile, PyZipFile, LargeZipFile, ZIP64_LIMIT, zlib, crc32, ZIP_DEFLATED
 from pdfrw.pdfwriter import PdfWriter, IndirectPdfDict, PdfName, \
     PdfOutputError, PdfDict, PdfString, user_fmt
+from pdfrw import PdfReader, PdfArray, PdfObject
+from pdfrw.compress import compress as do_compress
+from pdfrw.py23_diffs import convert_store
 
 
 class ImageThumbnail(object):
     size = (128, 128)
+    sizes = ((1024, 1024), (512, 512), (128, 128))  # Default sizes for create_many
     max_memory_size = 1024 * 1024 * 2  # 2mb
     # Max file size to be processed, since the image data needs to be loaded completely in memory.
     max_file_size = 1024 * 1024 * 15
     format = "PNG"  # Leave None to use original format
     quality = Image.ANTIALIAS
 
+    # Images are rejected from their header, before being decoded, if they are bigger than this.
+    max_pixels = 1000 * 1000 * 50  # 50 megapixels
+    max_frames = 200  # For animated images.
+
+    # Bytes downloaded to check stored images, retried with max_header_size if headers are bigger (EXIF data).
+    header_size = 1024 * 16  # 16kb
+    max_header_size = 1024 * 256  # 256kb
+
     @classmethod
     def check_file(self, data):
         """
@@ -43,6 +59,92 @@ class ImageThumbnail(object):
         if size > self.max_file_size:
             raise ValueError("File is too big.")
 
+    @classmethod
+    def read_header(cls, data, partial=False):
+        """
+        Reads an image header from a file-like object without decoding it.
+        Returns a dict with:
+            format, width, height
+            frames: amount of frames, None if unknown because data is partial (only the file start) or the image
+            is bigger than max_pixels.
+
+        Raises ValueError if data is not a valid image.
+        """
+        try:
+            img = Image.open(data)
+        except Exception:
+            raise ValueError("Invalid image file.")
+
+        return cls._header_info(img, partial)
+
+    @classmethod
+    def _header_info(cls, img, partial=False):
+        width, height = img.size
+        frames = 1
+
+        # Only multi frame formats have n_frames (checked on the class, reading it counts the frames). Counting
+        # seeks through every frame, which can decode the previous one, so it is skipped for partial data and
+        # images already too big to be accepted.
+        if hasattr(type(img), 'n_frames'):
+            frames = None
+            if not partial and width * height <= cls.max_pixels:
+                try:
+                    frames = img.n_frames
+                except Exception:
+                    raise ValueError("Invalid image file.")
+
+        return {
+            'format': img.format,
+            'width': width,
+            'height': height,
+            'frames': frames
+        }
+
+    @classmethod
+    def check_header(cls, info):
+        """
+        Checks an image header info, returned by read_header, against the pixel and frame limits.
+        Raises ValueError if the image is too big.
+        """
+        if info['width'] * info['height'] > cls.max_pixels:
+            raise ValueError("Image dimensions are too big.")
+
+        if info['frames'] is not None and info['frames'] > cls.max_frames:
+            raise ValueError("Image has too many frames.")
+
+    @classmethod
+    def check_stored(cls, storage, name):
+        """
+        Checks a file stored on a BaseS3Storage reading only its first bytes, checking the file size and header.
+        Returns the header info (see read_header).
+
+        Raises ValueError if the image is not valid or too big, and NotFound if it doesn't exist.
+        """
+        head = storage.head_file(name)
+
+        if head['size'] > cls.max_file_size:
+            raise ValueError("File is too big.")
+        if not head['size']:
+            raise ValueError("Invalid image file.")
+
+        header_size = cls.header_size
+
+        while 1:
+            end = min(header_size, head['size'])
+            data = storage.download_range(name, 0, end - 1, head['etag'])
+
+            try:
+                info = cls.read_header(BytesIO(data), partial=end < head['size'])
+                break
+            except ValueError:
+                if end >= min(cls.max_header_size, head['size']):
+                    raise
+                header_size = cls.max_header_size
+
+        cls.check_header(info)
+
+        return info
+
     @classmethod
     def create(cls, data):
         """
@@ -57,6 +159,32 @@ class ImageThumbnail(object):
         
         """
 
+        renditions, img_format = cls.create_many(data, (cls.size,))
+
+        return renditions[0][1], img_format
+
+    @staticmethod
+    def _fit(size, box):
+        # Size of an image of the given size scaled down to fit box keeping its aspect ratio, as Image.thumbnail.
+        x, y = size
+        if x > box[0]:
+            y = max(int(y * box[0] / x), 1)
+            x = box[0]
+        if y > box[1]:
+            x = max(int(x * box[1] / y), 1)
+            y = box[1]
+        return x, y
+
+    @classmethod
+    def create_many(cls, data, sizes=None):
+        """
+        Same as create but creates a thumbnail for each of the given sizes (defaults to cls.sizes) decoding the
+        image only once. Each thumbnail is resized from the smallest previous one that still covers it (or from
+        the image) and JPEG images are decoded at the lowest resolution that covers every size.
+        Returns a list of (size, temporary file) sorted from the biggest to the smallest size, the caller is
+        responsable of closing the files. Also returns the thumbnails extension (without the "." )
+        """
+
         cls.check_file(data)
 
         try:
@@ -64,15 +192,78 @@ class ImageThumbnail(object):
         except Exception:
             raise ValueError("Invalid image file.")
 
-        res = SpooledTemporaryFile(max_size=cls.max_memory_size, mode='w+b', prefix='thmbtemp')
+        # Image.open only reads the header, check it before pixels are decoded.
+        cls.check_header(cls._header_info(img))
 
         img_format = (cls.format or img.format)
+        sizes = sorted(sizes or cls.sizes, key=lambda s: s[0] * s[1], reverse=True)
+        targets = [cls._fit(img.size, size) for size in sizes]
 
-        img.thumbnail(cls.size, cls.quality)
-        img.save(res, format=img_format)
-        res.seek(0)
+        # Only affects JPEG files, which can be decoded scaled down by 1/2, 1/4 or 1/8.
+        img.draft(None, (max(t[0] for t in targets), max(t[1] for t in targets)))
 
-        return res, img_format
+        renditions = []
+        resized = []
+
+        try:
+            for size, target in zip(sizes, targets):
+                covering = [r for r in resized if r.size[0] >= target[0] and r.size[1] >= target[1]]
+                source = min(covering, key=lambda r: r.size[0] * r.size[1]) if covering else img
+                thumb = source if source.size == target else source.resize(target, cls.quality)
+                resized.append(thumb)
+
+                res = SpooledTemporaryFile(max_size=cls.max_memory_size, mode='w+b', prefix='thmbtemp')
+                renditions.append((size, res))
+
+                thumb.save(res, format=img_format)
+                res.seek(0)
+        except Exception:
+            for _, res in renditions:
+                res.close()
+            raise
+
+        return renditions, img_format
+
+
+def _compress_entry(stream, compress_type, max_memory):
+    """
+    Compresses a stream into a spooled temporary file, closing the stream.
+    Returns uncompressed size, CRC, compressed size and the file.
+    """
+    res = SpooledTemporaryFile(max_size=max_memory, mode='w+b', prefix='ziptemp')
+    cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) \
+        if compress_type == ZIP_DEFLATED else None
+
+    file_size = 0
+    compress_size = 0
+    CRC = 0
+
+    try:
+        while 1:
+            buf = stream.read(1024 * 64)
+            if not buf:
+                break
+            file_size = file_size + len(buf)
+            CRC = crc32(buf, CRC) & 0xffffffff
+            if cmpr:
+                buf = cmpr.compress(buf)
+            compress_size = compress_size + len(buf)
+            res.write(buf)
+
+        if cmpr:
+            buf = cmpr.flush()
+            compress_size = compress_size + len(buf)
+            res.write(buf)
+
+    except Exception:
+        res.close()
+        raise
+
+    finally:
+        if hasattr(stream, 'close'):
+            stream.close()
+
+    return file_size, CRC, compress_size, res
 
 
 class ZipFile2(ZipFile):
@@ -80,6 +271,9 @@ class ZipFile2(ZipFile):
     Wrapper class around zip file to allow writing from a stream without reading everything into memory
     """
 
+    compress_workers = 4  # Threads of the process wide pool used by write_many, set before its first use.
+    max_entry_memory = 1024 * 1024 * 4  # 4mb, compressed entries bigger than this are spooled to disk.
+
     def write_stream(self, arcname, stream, compress_type=None):
         """
         Wriets to the zip file from a stream in an efficient way
@@ -164,6 +358,200 @@ class ZipFile2(ZipFile):
         self.fp.seek(position, 0)
         self.filelist.append(zinfo)
         self.NameToInfo[zinfo.filename] = zinfo
+        self.start_dir = position  # Central directory is written here on close
+
+    def write_many(self, entries, compress_type=None, max_pending=None):
+        """
+        Writes many (arcname, stream) entries, compressing them concurrently on compress_workers threads (zlib
+        releases the GIL while compressing) and writing them in order.
+        Each entry is compressed into a spooled temporary file and at most max_pending entries (defaults to twice
+        the workers) are compressed or waiting to be written, so memory is bounded by max_pending * max_entry_memory.
+        streams don't need to be seekable or have a size, each one is closed once compressed.
+        """
+
+        if not self.fp:
+            raise RuntimeError("Attempt to write to ZIP archive that was already closed")
+
+        if compress_type is None:
+            compress_type = self.compression
+
+        max_pending = max_pending or self.compress_workers * 2
+        pool = get_shared_pool('zip_compress', self.compress_workers)
+        pending = deque()
+
+        try:
+            for arcname, stream in entries:
+                res = pool.apply_async(_compress_entry, (stream, compress_type, self.max_entry_memory))
+                pending.append((arcname, res))
+
+                if len(pending) >= max_pending:
+                    arcname, res = pending.popleft()
+                    self._write_compressed(arcname, compress_type, *res.get())
+
+            while pending:
+                arcname, res = pending.popleft()
+                self._write_compressed(arcname, compress_type, *res.get())
+
+        except Exception:
+            for _, res in pending:
+                try:
+                    res.get()[3].close()
+                except Exception:
+                    pass
+            raise
+
+    def _write_compressed(self, arcname, compress_type, file_size, CRC, compress_size, data):
+        # Sizes and CRC are known so the header is written once, no need to seek.
+        try:
+            zinfo = ZipInfo(arcname, time.localtime(time.time())[:6])
+            zinfo.external_attr = 0o600 << 16  # ?rw-------
+            zinfo.compress_type = compress_type
+            zinfo.file_size = file_size
+            zinfo.compress_size = compress_size
+            zinfo.CRC = CRC
+            zinfo.flag_bits = 0x00
+            zinfo.header_offset = self.fp.tell()
+
+            self._writecheck(zinfo)
+            self._didModify = True
+
+            self.fp.write(zinfo.FileHeader(file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT))
+            data.seek(0)
+            shutil.copyfileobj(data, self.fp, 1024 * 64)
+        finally:
+            data.close()
+
+        self.filelist.append(zinfo)
+        self.NameToInfo[zinfo.filename] = zinfo
+        self.start_dir = self.fp.tell()
+
+
+class _ChunkWriter(object):
+    """
+    Write only file that keeps written data until drained, ZipFile handles it as a non seekable output.
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        self.size = 0
+        return data
+
+
+class ZipStream(object):
+    """
+    Writes a zip file as a stream of byte chunks, for non seekable outputs such as a StreamingHttpResponse.
+    Entries CRC and sizes are written after their data (data descriptors), so entries data can be any file-like
+    object or bytes iterator without a known size. Memory doesn't depend on the entries size.
+
+        response = StreamingHttpResponse(ZipStream().stream(entries), content_type='application/zip')
+    """
+
+    chunk_size = 1024 * 64
+
+    def __init__(self, compression=ZIP_DEFLATED, allow_zip64=True):
+        self.compression = compression
+        self._writer = _ChunkWriter()
+        self._zip = ZipFile(self._writer, 'w', compression, allow_zip64)
+
+    def stream(self, entries):
+        """
+        Yields the chunks of a complete zip file with the given (arcname, data) entries.
+        """
+        for arcname, data in entries:
+            for chunk in self.write(arcname, data):
+                yield chunk
+
+        for chunk in self.close():
+            yield chunk
+
+    def write(self, arcname, data, compress_type=None):
+        """
+        Yields the chunks of a new entry. data can be bytes, a file-like object or an iterator of bytes.
+        Entries without a size (or bigger than 4gb) use ZIP64 sizes.
+        """
+        zf = self._zip
+        if not zf.fp:
+            raise RuntimeError("Attempt to write to ZIP archive that was already closed")
+
+        zinfo = ZipInfo(arcname, time.localtime(time.time())[:6])
+        zinfo.external_attr = 0o600 << 16  # ?rw-------
+        zinfo.compress_type = self.compression if compress_type is None else compress_type
+        zinfo.flag_bits = 0x08  # CRC and sizes on the data descriptor
+        zinfo.header_offset = zf.fp.tell()
+        zinfo.file_size = zinfo.compress_size = zinfo.CRC = 0
+
+        if isinstance(data, (bytes, bytearray)):
+            size = len(data)
+            data = (data,)
+        elif hasattr(data, 'read'):
+            size = getattr(data, 'size', None)
+            data = iter(partial(data.read, self.chunk_size), b'')
+        else:
+            size = None
+
+        zip64 = zf._allowZip64 and (size is None or size * 1.05 > ZIP64_LIMIT)
+
+        zf._writecheck(zinfo)
+        zf._didModify = True
+        zf.fp.write(zinfo.FileHeader(zip64))
+
+        cmpr = zlib.compressobj(zlib.Z_DEFAULT_COMPRESSION, zlib.DEFLATED, -15) \
+            if zinfo.compress_type == ZIP_DEFLATED else None
+
+        file_size = 0
+        compress_size = 0
+        CRC = 0
+
+        for buf in data:
+            file_size = file_size + len(buf)
+            CRC = crc32(buf, CRC) & 0xffffffff
+            if cmpr:
+                buf = cmpr.compress(buf)
+            compress_size = compress_size + len(buf)
+            zf.fp.write(buf)
+
+            if self._writer.size >= self.chunk_size:
+                yield self._writer.drain()
+
+        if cmpr:
+            buf = cmpr.flush()
+            compress_size = compress_size + len(buf)
+            zf.fp.write(buf)
+
+        if not zip64 and (file_size > ZIP64_LIMIT or compress_size > ZIP64_LIMIT):
+            raise LargeZipFile("File size is too big without ZIP64 extensions")
+
+        zinfo.file_size = file_size
+        zinfo.compress_size = compress_size
+        zinfo.CRC = CRC
+
+        zf.fp.write(struct.pack('<4sLQQ' if zip64 else '<4sLLL', b'PK\x07\x08', CRC, compress_size, file_size))
+
+        zf.filelist.append(zinfo)
+        zf.NameToInfo[zinfo.filename] = zinfo
+        zf.start_dir = zf.fp.tell()
+
+        yield self._writer.drain()
+
+    def close(self):
+        """
+        Yields the last chunk, with the central directory.
+        """
+        self._zip.close()
+        yield self._writer.drain()
 
 
 # Extend pdfrw to be able to add bookmarks and metadata
@@ -178,40 +566,99 @@ class NewPdfWriter(PdfWriter):
         page_num must be a valid page number in the writer
         and parent can be a bookmark object returned by
         a previous add_bookmark call
+        For many entries use set_outline instead.
         """
 
-        try:
-            page = self.pagearray[page_num]
-        except IndexError:
-            # TODO: Improve error handling ?            
-            raise PdfOutputError("Invalid page number: %s" % (pageNum))
+        page = self._bookmark_page(page_num)
 
         parent = parent or self._outline
         if parent is None:
             parent = self._outline = IndirectPdfDict()
 
-        bookmark = IndirectPdfDict(
-            Parent=parent,
-            Title=PdfString.encode(title),
-            A=PdfDict(
-                D=[page, PdfName.Fit],
-                S=PdfName.GoTo
-            )
-        )
+        bookmark = self._new_bookmark(title, page, parent)
 
         if parent.Count:
-            parent.Count += 1
             prev = parent.Last
             bookmark.Prev = prev
             prev.Next = bookmark
             parent.Last = bookmark
         else:
-            parent.Count = 1
             parent.First = bookmark
             parent.Last = bookmark
 
+        # Count is the amount of open descendants, so every ancestor is updated
+        node = parent
+        while node is not None:
+            node.Count = (node.Count or 0) + 1
+            node = node.Parent
+
         return bookmark
 
+    def set_outline(self, tree):
+        """
+        Replaces the outline with the given tree in one pass, tree is a list of
+        (title, page_num) or (title, page_num, children) entries where children
+        is a list of entries too:
+
+            writer.set_outline([
+                ('Chapter 1', 0, [('Section 1.1', 1), ('Section 1.2', 3)]),
+                ('Chapter 2', 5)
+            ])
+
+        Returns the outline root, or None if tree is empty.
+        """
+        if not tree:
+            self._outline = None
+            return None
+
+        self._outline = IndirectPdfDict()
+        self._build_outline(self._outline, tree)
+        return self._outline
+
+    def _build_outline(self, parent, entries):
+        # Links entries as parent children, returning the amount of descendants.
+        # Recursion depth is the outline depth, not its size.
+        prev = None
+        count = 0
+
+        for entry in entries:
+            bookmark = self._new_bookmark(entry[0], self._bookmark_page(entry[1]), parent)
+
+            if prev is None:
+                parent.First = bookmark
+            else:
+                bookmark.Prev = prev
+                prev.Next = bookmark
+
+            prev = bookmark
+            count += 1
+
+            if len(entry) > 2 and entry[2]:
+                count += self._build_outline(bookmark, entry[2])
+
+        if prev is not None:
+            parent.Last = prev
+            parent.Count = count
+
+        return count
+
+    def _bookmark_page(self, page_num):
+        try:
+            return self.pagearray[page_num]
+        except IndexError:
+            raise PdfOutputError("Invalid page number: %s" % (page_num))
+
+    @staticmethod
+    def _new_bookmark(title, page, parent):
+        return IndirectPdfDict(
+            Parent=parent,
+            Title=PdfString.encode(title),
+            A=PdfDict(
+                D=[page, PdfName.Fit],
+                S=PdfName.GoTo
+            )
+        )
+
     def set_info(self, info):
         """
         Sets pdf metadata, info must be a dict where each key is the metadata key
@@ -234,3 +681,212 @@ class NewPdfWriter(PdfWriter):
             self.trailer.Root.Outlines = self._outline
 
         super(NewPdfWriter, self).write(fname, trailer, user_fmt, disable_gc)
+
+
+class StreamingPdfWriter(NewPdfWriter):
+    """
+    Merges pages into a PDF written as pages are added, instead of keeping every page and object until write.
+    Each page and the objects it uses are written as soon as it's added, only the objects offsets, the pages
+    references and the outline are kept, and the page tree, outline, info and trailer are written on close.
+    f can be any file-like object with write, it doesn't need to be seekable.
+
+        writer = StreamingPdfWriter(f)
+        writer.add_document(data)
+        writer.add_bookmark('Title', 0)
+        writer.close()
+
+    Bookmarks and info are added as in NewPdfWriter, pagearray has a reference for each page written.
+    """
+
+    def __init__(self, f, version='1.3', compress=False):
+        super(StreamingPdfWriter, self).__init__(version=version, compress=compress)
+        self.f = f
+        self.closed = False
+
+        self._offset = 0
+        self._offsets = [None, None]  # Catalog and page tree objects are written last.
+        self._root_ref = PdfObject('1 0 R')
+        self._pages_ref = PdfObject('2 0 R')
+        self._written = {}  # id(obj): (reference, obj) of the objects of the current document.
+        self._added = set()  # id(page) of the pages of the current document already written.
+
+        self._write('%%PDF-%s\n%%\xe2\xe3\xcf\xd3\n' % version)
+
+    def _write(self, s):
+        s = convert_store(s)
+        self.f.write(s)
+        self._offset += len(s)
+
+    def _reserve(self):
+        self._offsets.append(None)
+        return PdfObject('%s 0 R' % len(self._offsets))
+
+    def add_document(self, data, pages=None):
+        """
+        Adds the pages of a PDF, given as a file path, bytes or a file-like object (such as a S3RawFile).
+        pages can be a list of page indexes to add, all pages by default.
+        The document is released once its pages are written, so memory is bounded by the largest document.
+        If it fails none of its pages are added, and the writer can still be used and closed.
+        """
+        if isinstance(data, (bytes, bytearray)):
+            reader = PdfReader(fdata=bytes(data))
+        else:
+            reader = PdfReader(data)
+
+        source = reader.pages
+        selected = [source[i] for i in pages] if pages is not None else source
+
+        page_count = len(self.pagearray)
+
+        try:
+            # Reserve the pages first so links between them point to the new pages, repeated pages link to the
+            # first copy.
+            for page in selected:
+                if id(page) not in self._written:
+                    self._written[id(page)] = (self._reserve(), page)
+
+            for page in selected:
+                self.addpage(page)
+
+        except Exception:
+            # Objects already written are left unreferenced, reserved ones are written as null on close.
+            del self.pagearray[page_count:]
+            raise
+
+        finally:
+            self.end_document()
+
+    def addpage(self, page):
+        if self.closed:
+            raise PdfOutputError("Attempt to add a page to a closed writer")
+        if page.Type != PdfName.Page:
+            raise PdfOutputError('Bad /Type:  Expected %s, found %s' % (PdfName.Page, page.Type))
+
+        # A page added again is written again, as a new page.
+        written = self._written.get(id(page))
+        if written is None or id(page) in self._added:
+            ref = self._reserve()
+            if written is None:
+                self._written[id(page)] = (ref, page)
+        else:
+            ref = written[0]
+        self._added.add(id(page))
+
+        # Same as pdfrw, copy the page with its inherited attributes and point it to the new page tree.
+        inheritable = page.inheritable
+        new_page = PdfDict(page, Resources=inheritable.Resources, MediaBox=inheritable.MediaBox,
+                           CropBox=inheritable.CropBox, Rotate=inheritable.Rotate, Parent=self._pages_ref)
+
+        self._write_object(ref, new_page)
+        self.pagearray.append(ref)
+
+        return self
+
+    def end_document(self):
+        """
+        Forgets the objects written for the current document, so it can be released.
+        Called by add_document, call it after adding all pages of a document with addpage.
+        """
+        self._written = {}
+        self._added = set()
+
+    def _write_object(self, ref, obj):
+        # Written objects are queued instead of recursing so deep object graphs don't hit the recursion limit.
+        queue = [(ref, obj)]
+
+        while queue:
+            ref, obj = queue.pop()
+            data = '%s obj\n%s\nendobj\n' % (ref[:-2], self._format(obj, queue))
+            self._offsets[int(ref.split(' ', 1)[0]) - 1] = self._offset
+            self._write(data)
+
+    def _format_value(self, obj, queue):
+        if isinstance(obj, PdfDict):
+            if obj.Type == PdfName.Catalog:
+                return self._root_ref
+            if obj.Type == PdfName.Pages:
+                return self._pages_ref
+            indirect = obj.indirect or obj.stream is not None or obj.Type == PdfName.Page
+        else:
+            indirect = isinstance(obj, PdfArray) and obj.indirect
+
+        if not indirect:
+            return self._format(obj, queue)
+
+        written = self._written.get(id(obj))
+        if written is not None:
+            return written[0]
+
+        # Pages not added are not written.
+        if obj.Type == PdfName.Page:
+            return 'null'
+
+        ref = self._reserve()
+        self._written[id(obj)] = (ref, obj)
+        queue.append((ref, obj))
+        return ref
+
+    def _format(self, obj, queue):
+        if isinstance(obj, (PdfArray, list, tuple)):
+            return '[%s]' % ' '.join(self._format_value(x, queue) for x in obj)
+
+        if isinstance(obj, (PdfDict, dict)):
+            if not isinstance(obj, PdfDict):
+                obj = PdfDict(obj)
+
+            if self.compress and obj.stream:
+                do_compress([obj])
+
+            pairs = sorted((getattr(k, 'encoded', None) or k, v) for k, v in obj.iteritems())
+            res = '<<%s>>' % ' '.join('%s %s' % (k, self._format_value(v, queue)) for k, v in pairs)
+
+            if obj.stream is not None:
+                res = '%s\nstream\n%s\nendstream' % (res, obj.stream)
+            return res
+
+        if hasattr(obj, 'indirect'):
+            return str(getattr(obj, 'encoded', None) or obj)
+        return user_fmt(obj)
+
+    def close(self):
+        """
+        Writes the page tree, outline, info and trailer. The file is not closed.
+        """
+        if self.closed:
+            return
+
+        self.end_document()
+
+        catalog = PdfDict(Type=PdfName.Catalog, Pages=self._pages_ref)
+        if self._outline is not None:
+            catalog.Outlines = self._outline
+
+        pages = PdfDict(Type=PdfName.Pages, Count=PdfObject(len(self.pagearray)), Kids=self.pagearray)
+
+        self._write_object(self._pages_ref, pages)
+        self._write_object(self._root_ref, catalog)
+
+        trailer = PdfDict(Root=self._root_ref)
+        if self._info:
+            trailer.Info = self._reserve()
+            self._write_object(trailer.Info, PdfDict(**self._info))
+
+        # Reserved by a failed document or object, written as null so the xref table is complete.
+        for i, offset in enumerate(self._offsets):
+            if offset is None:
+                self._offsets[i] = self._offset
+                self._write('%s 0 obj\nnull\nendobj\n' % (i + 1))
+
+        trailer.Size = PdfObject(len(self._offsets) + 1)
+
+        xref_offset = self._offset
+        xref = ['xref\n0 %s\n' % (len(self._offsets) + 1), '0000000000 65535 f\r\n']
+        xref.extend('%010d 00000 n\r\n' % offset for offset in self._offsets)
+
+        self._write(''.join(xref))
+        self._write('trailer\n\n%s\nstartxref\n%s\n%%%%EOF\n' % (self._format(trailer, []), xref_offset))
+
+        self.closed = True
+
+    def write(self, fname=None, trailer=None, user_fmt=user_fmt, disable_gc=True):
+        raise PdfOutputError("StreamingPdfWriter is written while pages are added, use close.")
@@ -0,0 +1,128 @@
+import time
+
+from builtins import object
+from collections import deque
+from zipfile import ZIP_DEFLATED
+from core.thread_pool import get_shared_pool
+from core.utils import ZipFile2, ZipStream
+
+'''
+    Zip files of storage files, downloading the next files while the current one is compressed, so network and CPU
+    overlap. Downloads run on a process wide pool, separate from the storages transfer pools since big downloads
+    use those for their ranges.
+'''
+
+
+def _timed_download(storage, name):
+    start = time.perf_counter()
+    f = storage.download_file(name, stream=False)
+    return f, time.perf_counter() - start
+
+
+class ZipExport(object):
+    """
+        Zip file of the given storage files, written to a seekable file with write or streamed with stream.
+        At most prefetch files are downloaded ahead of the one being compressed, as temporary files.
+        Timings are kept on stats, see get_stats.
+    """
+
+    download_workers = 4  # Threads of the process wide download pool.
+
+    def __init__(self, storage, names, prefetch=4, arcname=None):
+        """
+            names: storage file names, in the order they are added to the zip.
+            arcname: optional callable returning the zip name of each file, defaults to the file name.
+        """
+        self.storage = storage
+        self.names = names
+        self.prefetch = max(prefetch, 1)
+        self.arcname = arcname or (lambda name: name)
+
+        self.stats = {
+            'files': 0,
+            'bytes': 0,
+            'download': 0,  # Sum of each download time, they run concurrently.
+            'download_wait': 0,  # Time waiting for downloads, not overlapped with compression.
+            'write': 0,  # Time compressing and writing (or sending when streaming) files.
+            'total': 0
+        }
+
+    def entries(self):
+        """
+            Yields (arcname, file) for each downloaded file, the consumer is responsable of closing each file.
+            Can be given to ZipFile2.write_many, which closes them once compressed.
+        """
+        stats = self.stats
+        pool = get_shared_pool('zip_export_download', self.download_workers)
+        pending = deque()
+        names = iter(self.names)
+        start = time.perf_counter()
+
+        for name in names:
+            pending.append((name, pool.apply_async(_timed_download, (self.storage, name))))
+            if len(pending) >= self.prefetch:
+                break
+
+        try:
+            while pending:
+                name, res = pending.popleft()
+
+                wait_start = time.perf_counter()
+                f, elapsed = res.get()
+                stats['download_wait'] += time.perf_counter() - wait_start
+                stats['download'] += elapsed
+
+                # Queue the next download before using this one.
+                for next_name in names:
+                    pending.append((next_name, pool.apply_async(_timed_download, (self.storage, next_name))))
+                    break
+
+                # Files may still be read after the next one is requested (write_many), the consumer closes them.
+                write_start = time.perf_counter()
+                yield self.arcname(name), f
+                stats['write'] += time.perf_counter() - write_start
+
+                stats['files'] += 1
+                stats['bytes'] += f.size
+
+        finally:
+            # Stopped early or failed, don't leave downloaded temporary files open.
+            for _, res in pending:
+                try:
+                    res.get()[0].close()
+                except Exception:
+                    pass
+
+            stats['total'] = time.perf_counter() - start
+
+    def stream(self, compression=ZIP_DEFLATED):
+        """
+            Yields the zip file chunks, for a StreamingHttpResponse.
+        """
+        zip_stream = ZipStream(compression)
+
+        for arcname, f in self.entries():
+            with f:
+                for chunk in zip_stream.write(arcname, f):
+                    yield chunk
+
+        for chunk in zip_stream.close():
+            yield chunk
+
+    def write(self, fileobj, compression=ZIP_DEFLATED):
+        """
+            Writes the zip file to a seekable file-like object.
+        """
+        with ZipFile2(fileobj, 'w', compression) as z:
+            for arcname, f in self.entries():
+                with f:
+                    z.write_stream(arcname, f)
+
+    def get_stats(self):
+        """
+            Returns the stats with 'bound': 'network' if more time was spent waiting for downloads than writing,
+            'cpu' otherwise.
+        """
+        stats = dict(self.stats)
+        stats['bound'] = 'network' if stats['download_wait'] > stats['write'] else 'cpu'
+        return stats
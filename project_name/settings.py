@@ -83,6 +83,13 @@ CACHES = {
         # 'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
         'LOCATION': 'cache',
         'TIMEOUT': 60
+    },
+    # Validated user tokens, see clients.auth.user_auth. Should be shared by all processes and hosts in production
+    # (memcached or redis), local memory is only shared by the threads of each process.
+    'auth': {
+        'BACKEND': os.environ.get("AUTH_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get("AUTH_CACHE_LOCATION", 'auth'),
+        'TIMEOUT': 15
     }
 }
 
@@ -304,6 +311,13 @@ LOGGING = {
             'level': 'DEBUG',
         },
 
+        # Process pools logging
+        'process_pool': {
+            'handlers': ['console', 'centralErrors'],
+            'propagate': False,
+            'level': 'DEBUG',
+        },
+
         # Email
         'email.sending': {
             'handlers': ['console', 'centralErrors'],
@@ -344,8 +358,10 @@ LOGGING = {
 
     }
 }
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 # Disable logging while testing
-if len(sys.argv) > 1 and sys.argv[1] == 'test':
+if TESTING:
     logging.disable(logging.CRITICAL)
 
 LOCALE_PATHS = (
@@ -389,6 +405,10 @@ REST_FRAMEWORK = {
 # This is only a factor/multipler and not the real value
 THREAD_POOL_SIZE_FACTOR = int(os.environ.get("THREAD_POOL_SIZE_FACTOR", 1))
 
+# Worker processes for each CPU bound process pool (images, PDFs), on each web server process.
+# 0 runs those jobs on the request thread.
+PROCESS_POOL_SIZE = int(os.environ.get("PROCESS_POOL_SIZE", 2))
+
 # Make this unique, and don't share it with anybody.
 # This secret key is very important and used by django framework in many places.
 SECRET_KEY = os.environ.get("DJANGO_SECRET_KEY", '<someKey>')
@@ -438,4 +458,12 @@ AWS_KEY = os.environ.get("AWS_KEY", "")
 AWS_SECRET = os.environ.get("AWS_SECRET", "")
 S3_UPLOAD_BUCKET = os.environ.get("S3_UPLOAD_BUCKET", "")
 S3_UPLOAD_PREFIX = os.environ.get("S3_UPLOAD_PREFIX", "")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL", "")  # Optional, to use a local fake S3 service.
+# Optional in process fake S3 ('memory' or a folder path) to work offline, always used when testing.
+S3_FAKE_BACKEND = os.environ.get("S3_FAKE_BACKEND", "memory" if TESTING else "")
+S3_CACHE_DIR = os.environ.get("S3_CACHE_DIR", "")  # Optional, host folder to cache downloaded files.
+S3_CACHE_MAX_SIZE = int(os.environ.get("S3_CACHE_MAX_SIZE", 1024 * 1024 * 512))
+S3_UPLOAD_SPOOL_DIR = os.environ.get("S3_UPLOAD_SPOOL_DIR", "")  # Optional, host folder for background uploads.
+# Resume background uploads left by dead processes when the web server starts.
+S3_RESUME_UPLOADS = os.environ.get("S3_RESUME_UPLOADS", "True") == "True"
 SES_REGION = os.environ.get("SES_REGION", 'us-west-2')